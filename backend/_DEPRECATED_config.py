@@ -1,14 +1,15 @@
-from supabase import create_client
 import os
 from dotenv import load_dotenv
+from backend.http_pool import create_supabase_client
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Create Supabase client
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Create Supabase client; table, storage and auth calls share one pooled
+# keep-alive (HTTP/2) connection pool, see http_pool.py
+supabase = create_supabase_client(SUPABASE_URL, SUPABASE_KEY)
 
 # Test the connection
 try:
@@ -1,4 +1,6 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timedelta
@@ -9,6 +11,9 @@ from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import Optional
 from backend._DEPRECATED_config import supabase
+from backend.http_pool import http_pool
+from backend.uploads import UploadError, receive_upload
+from backend.user_cache import UserCache
 import logging
 
 # Load environment variables
@@ -34,6 +39,25 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The supabase client and bcrypt block, so every route runs them on this pool
+# instead of the event loop: a slow query then holds one thread while other
+# requests keep being served. Size it above SUPABASE_HTTP_MAX_CONNECTIONS so
+# HTTP/2 can multiplex concurrent queries.
+BLOCKING_WORKERS = int(os.getenv("API_BLOCKING_WORKERS", "32"))
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="api-blocking")
+
+async def run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(blocking_executor, fn, *args)
+
+async def execute(query):
+    """Run a PostgREST query (anything with .execute()) off the event loop"""
+    return await run_blocking(query.execute)
+
+# Authenticated users (user_id, email, role) by user_id, so routes skip the
+# users lookup; see user_cache.py for USER_CACHE_TTL
+user_cache = UserCache()
+AUTH_USER_COLUMNS = "user_id,email,role"
+
 # ====== MODELS ======
 class UserCreate(BaseModel):
     email: str
@@ -76,27 +100,41 @@ class AppointmentWithPayment(BaseModel):
     payment: PaymentDetails
 
 # ====== AUTH HELPERS ======
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    """The authenticated user as {"user_id", "email", "role"}, from user_cache when possible"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return payload["sub"]
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def is_admin(current_user: str = Depends(get_current_user)):
-    user = supabase.table("users").select("role").eq("email", current_user).execute().data[0]
-    if user['role'] != 'admin':
+    user_id = payload.get("user_id")
+    user = user_cache.get(user_id) if user_id is not None else None
+    if user is None:
+        # The role is always read from the database rather than the token, so a
+        # role change or deletion applies within USER_CACHE_TTL, not at expiry.
+        # Tokens issued before user_id was added are looked up by email.
+        query = supabase.table("users").select(AUTH_USER_COLUMNS)
+        query = query.eq("user_id", user_id) if user_id is not None else query.eq("email", payload["sub"])
+        response = await execute(query)
+        if not response.data:
+            raise HTTPException(status_code=401, detail="User no longer exists")
+        user = response.data[0]
+        user_cache.put(user)
+    return user
+
+async def is_admin(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
 # ====== AUTH ROUTES ======
 @app.post("/signup")
 async def signup(user: UserCreate):
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = await run_blocking(bcrypt.hashpw, user.password.encode('utf-8'), bcrypt.gensalt())
     try:
-        response = supabase.table("users").insert({
+        response = await execute(supabase.table("users").insert({
             "email": user.email,
             "password": hashed_password.decode('utf-8'),
             "full_name": user.full_name,
@@ -108,7 +146,7 @@ async def signup(user: UserCreate):
             "subscription_plan": user.subscription_plan,
             "payment_status": user.payment_status,
             "unlimited_scans": user.unlimited_scans
-        }).execute()
+        }))
         
         if not response.data:
             raise HTTPException(status_code=400, detail="User creation failed")
@@ -123,25 +161,31 @@ async def signup(user: UserCreate):
 
 @app.post("/login")
 async def login(user: UserLogin):
-    response = supabase.table("users").select("*").eq("email", user.email).execute()
+    response = await execute(supabase.table("users").select("*").eq("email", user.email))
     if not response.data:
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     stored_user = response.data[0]
-    if not bcrypt.checkpw(user.password.encode('utf-8'), stored_user['password'].encode('utf-8')):
+    if not await run_blocking(bcrypt.checkpw, user.password.encode('utf-8'), stored_user['password'].encode('utf-8')):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     token = jwt.encode(
-        {"sub": user.email, "exp": datetime.utcnow() + timedelta(hours=1)},
+        {
+            "sub": user.email,
+            "user_id": stored_user["user_id"],
+            "role": stored_user["role"],
+            "exp": datetime.utcnow() + timedelta(hours=1)
+        },
         SECRET_KEY,
         algorithm="HS256"
     )
+    user_cache.put({column: stored_user[column] for column in AUTH_USER_COLUMNS.split(",")})
     return {"access_token": token, "token_type": "bearer"}
 
 @app.get("/user-info")
-async def get_user_info(current_user: str = Depends(get_current_user)):
+async def get_user_info(current_user: dict = Depends(get_current_user)):
     try:
-        user = supabase.table("users").select("*").eq("email", current_user).execute().data[0]
+        user = (await execute(supabase.table("users").select("*").eq("user_id", current_user["user_id"]))).data[0]
         return user
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -150,18 +194,15 @@ async def get_user_info(current_user: str = Depends(get_current_user)):
 @app.post("/appointments")
 async def create_appointment(
     appointment: AppointmentWithPayment, 
-    current_user: str = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user)
 ):
     try:
-        # Get user ID
-        user = supabase.table("users").select("user_id").eq("email", current_user).execute().data[0]
-        
         # Process payment (mock)
         payment_status = "paid"  # In real app, verify with payment gateway
         
         # Create appointment
         appointment_data = {
-            "user_id": user["user_id"],
+            "user_id": current_user["user_id"],
             "appointment_type": appointment.appointment_type,
             "facility": appointment.facility,
             "appointment_date": appointment.appointment_date,
@@ -176,7 +217,7 @@ async def create_appointment(
             "created_at": datetime.utcnow().isoformat()
         }
         
-        response = supabase.table("appointments").insert(appointment_data).execute()
+        response = await execute(supabase.table("appointments").insert(appointment_data))
         
         return {
             "message": "Appointment created successfully",
@@ -189,15 +230,13 @@ async def create_appointment(
 @app.get("/appointments/{appointment_id}")
 async def get_appointment(
     appointment_id: int,
-    current_user: str = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user)
 ):
     try:
-        user = supabase.table("users").select("user_id").eq("email", current_user).execute().data[0]
-        response = supabase.table("appointments")\
+        response = await execute(supabase.table("appointments")\
             .select("*")\
             .eq("consultation_id", appointment_id)\
-            .eq("user_id", user["user_id"])\
-            .execute()
+            .eq("user_id", current_user["user_id"]))
             
         if not response.data:
             raise HTTPException(status_code=404, detail="Appointment not found")
@@ -209,25 +248,22 @@ async def get_appointment(
 @app.put("/appointments/{appointment_id}/cancel")
 async def cancel_appointment(
     appointment_id: int,
-    current_user: str = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user)
 ):
     try:
-        user = supabase.table("users").select("user_id").eq("email", current_user).execute().data[0]
         
         # Verify appointment belongs to user
-        appointment = supabase.table("appointments")\
+        appointment = await execute(supabase.table("appointments")\
             .select("*")\
             .eq("consultation_id", appointment_id)\
-            .eq("user_id", user["user_id"])\
-            .execute()
+            .eq("user_id", current_user["user_id"]))
             
         if not appointment.data:
             raise HTTPException(status_code=404, detail="Appointment not found")
             
-        supabase.table("appointments")\
+        await execute(supabase.table("appointments")\
             .update({"status": "cancelled"})\
-            .eq("consultation_id", appointment_id)\
-            .execute()
+            .eq("consultation_id", appointment_id))
             
         return {"message": "Appointment cancelled"}
     except Exception as e:
@@ -236,28 +272,35 @@ async def cancel_appointment(
 # ====== SCAN ROUTES ======
 @app.post("/scans")
 async def upload_scan(
-    file: UploadFile = File(...),
-    scan_type: str = Form(...),
-    current_user: str = Depends(get_current_user)
+    request: Request,
+    current_user: dict = Depends(get_current_user)
 ):
+    # Multipart fields: file, scan_type. The file is streamed into a
+    # size-limited spool instead of being read into memory in one piece.
     try:
-        user = supabase.table("users").select("user_id").eq("email", current_user).execute().data[0]
-        
-        # Store file in Supabase Storage
-        file_content = await file.read()
-        file_path = f"scans/{user['user_id']}/{datetime.now().timestamp()}_{file.filename}"
+        upload = await receive_upload(request)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    scan_type = upload.fields.get("scan_type")
+    if not scan_type:
+        upload.close()
+        raise HTTPException(status_code=422, detail="scan_type is required")
+
+    try:
+        # Store file in Supabase Storage, streamed from the spool
+        file_path = f"scans/{current_user['user_id']}/{datetime.now().timestamp()}_{upload.filename}"
         
-        supabase.storage().from_("scans").upload(file_path, file_content)
+        await run_blocking(supabase.storage.from_("scans").upload, file_path, upload.reader())
         
         # Store metadata
         scan_data = {
-            "user_id": user["user_id"],
+            "user_id": current_user["user_id"],
             "scan_type": scan_type,
             "file_path": file_path,
             "created_at": datetime.utcnow().isoformat()
         }
         
-        response = supabase.table("scans").insert(scan_data).execute()
+        response = await execute(supabase.table("scans").insert(scan_data))
         
         return {
             "message": "Scan uploaded successfully",
@@ -265,15 +308,15 @@ async def upload_scan(
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        upload.close()
 
 @app.get("/patient/scans")
-async def get_patient_scans(current_user: str = Depends(get_current_user)):
+async def get_patient_scans(current_user: dict = Depends(get_current_user)):
     try:
-        user = supabase.table("users").select("user_id").eq("email", current_user).execute().data[0]
-        scans = supabase.table("scans")\
+        scans = await execute(supabase.table("scans")\
             .select("*")\
-            .eq("user_id", user["user_id"])\
-            .execute()
+            .eq("user_id", current_user["user_id"]))
             
         return {"scans": scans.data}
     except Exception as e:
@@ -281,9 +324,9 @@ async def get_patient_scans(current_user: str = Depends(get_current_user)):
 
 # ====== ADMIN ROUTES ======
 @app.get("/admin/users")
-async def get_users(current_user: str = Depends(is_admin)):
+async def get_users(current_user: dict = Depends(is_admin)):
     try:
-        users = supabase.table("users").select("*").execute()
+        users = await execute(supabase.table("users").select("*"))
         return {"users": users.data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -292,46 +335,54 @@ async def get_users(current_user: str = Depends(is_admin)):
 async def update_user(
     user_id: int,
     user_update: UserUpdate,
-    current_user: str = Depends(is_admin)
+    current_user: dict = Depends(is_admin)
 ):
     try:
-        supabase.table("users")\
+        await execute(supabase.table("users")\
             .update({
                 "full_name": user_update.full_name,
                 "gender": user_update.gender,
                 "date_of_birth": user_update.dob,
                 "phone_number": user_update.phone
             })\
-            .eq("user_id", user_id)\
-            .execute()
+            .eq("user_id", user_id))
             
         return {"message": "User updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        user_cache.invalidate(user_id)
 
 @app.delete("/admin/user/{user_id}")
 async def delete_user(
     user_id: int,
-    current_user: str = Depends(is_admin)
+    current_user: dict = Depends(is_admin)
 ):
     try:
-        supabase.table("users").delete().eq("user_id", user_id).execute()
+        await execute(supabase.table("users").delete().eq("user_id", user_id))
         return {"message": "User deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        user_cache.invalidate(user_id)
 
 @app.get("/admin/appointments")
-async def get_all_appointments(current_user: str = Depends(is_admin)):
+async def get_all_appointments(current_user: dict = Depends(is_admin)):
     try:
-        appointments = supabase.table("appointments").select("*").execute()
+        appointments = await execute(supabase.table("appointments").select("*"))
         return {"appointments": appointments.data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/admin/scans")
-async def get_all_scans(current_user: str = Depends(is_admin)):
+async def get_all_scans(current_user: dict = Depends(is_admin)):
     try:
-        scans = supabase.table("scans").select("*").execute()
+        scans = await execute(supabase.table("scans").select("*"))
         return {"scans": scans.data}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/http-pool")
+async def get_http_pool_stats(current_user: dict = Depends(is_admin)):
+    # Connection reuse ratio and pool wait times of the shared Supabase HTTP pool
+    return http_pool.stats()
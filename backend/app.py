@@ -1,56 +1,434 @@
-from flask import Flask, request, jsonify
-from PIL import Image
-import io
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+from datetime import datetime, timezone
+import json
+import os
+import threading
 import numpy as np
-import tensorflow as tf
-
-app = Flask(__name__)
-
-# Load your Keras model once when starting the app
-model = tf.keras.models.load_model(r"C:\Users\Informatics\Desktop\model.h5")
+from PIL import UnidentifiedImageError
+from batching import MicroBatcher
+from inference import warmup_batch_sizes
+from job_queue import FINISHED_STATUSES, JobRunner
+from model_registry import active_version, get_model, model_metrics, reload_in_background, watch_model_file
+from prediction_cache import PredictionCache
+from preprocessing import InputPool, load_input
+from uploads import MAX_UPLOAD_BYTES, UploadError, is_archive, iter_archive, receive_body, receive_upload, receive_uploads
 
 # Class labels for your 3 output neurons
 class_labels = ['pneumonia', 'normal', 'lung_cancer']
 
-def preprocess_image(image):
-    # Resize image to 224x224 as per your model input
-    img = image.resize((224, 224))
-    img_array = np.array(img) / 255.0  # normalize pixel values to [0,1]
-    
-    # Make sure it has 3 channels (RGB)
-    if img_array.shape[-1] != 3:
-        img_array = np.stack((img_array,) * 3, axis=-1)
-    
-    # Add batch dimension
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
-
-@app.route('/predict', methods=['POST'])
-def predict():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
-    
-    file = request.files['file']
-    img_bytes = file.read()
-    img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-    
-    # Preprocess image for your model
-    processed_img = preprocess_image(img)
-    
-    # Predict with your model
-    preds = model.predict(processed_img)
-    
+# Concurrent /predict calls are coalesced into one batched forward pass.
+# A batch runs once it is full or once the oldest request has waited this long.
+PREDICT_BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", "16"))
+PREDICT_BATCH_MAX_WAIT_MS = float(os.getenv("PREDICT_BATCH_MAX_WAIT_MS", "10"))
+
+# Hashing, cache lookups and image decoding run on PREDICT_WORKERS threads so
+# the event loop keeps accepting and reading uploads while CPU work happens.
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", "4"))
+
+# At most PREDICT_MAX_IN_FLIGHT /predict requests are admitted at once; beyond
+# that clients get 429 with Retry-After instead of queueing without bound.
+PREDICT_MAX_IN_FLIGHT = int(os.getenv("PREDICT_MAX_IN_FLIGHT", "64"))
+PREDICT_RETRY_AFTER = int(os.getenv("PREDICT_RETRY_AFTER", "1"))
+
+# POST /predict/batch limits: images per request (files plus archive members)
+# and request body size, which also bounds each file part (an archive can be
+# as large as the whole request). Archive members are still limited to
+# MAX_UPLOAD_BYTES each. Images are diagnosed in chunks of up to
+# PREDICT_BATCH_MAX_SIZE images and PREDICT_CHUNK_MAX_BYTES of encoded data;
+# archive members are spooled (to disk past UPLOAD_SPOOL_BYTES) as they are read.
+PREDICT_BATCH_MAX_FILES = int(os.getenv("PREDICT_BATCH_MAX_FILES", "1000"))
+PREDICT_BATCH_MAX_BYTES = int(os.getenv("PREDICT_BATCH_MAX_BYTES", str(2**30)))
+PREDICT_CHUNK_MAX_BYTES = int(os.getenv("PREDICT_CHUNK_MAX_BYTES", str(64 * 2**20)))
+
+# Job API (POST /jobs): JOB_WORKERS jobs are diagnosed concurrently, so they
+# share batches; submissions beyond JOB_MAX_PENDING queued jobs get 429.
+# Long-polls (GET /jobs/{id}?wait=) are capped at JOB_MAX_WAIT seconds.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(PREDICT_BATCH_MAX_SIZE)))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "10000"))
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "60"))
+JOB_EVENTS_KEEPALIVE = 15
+
+# Admin token for POST /admin/reload-model; the endpoint is disabled when unset
+MODEL_RELOAD_TOKEN = os.getenv("MODEL_RELOAD_TOKEN")
+
+def predict_batch(batch):
+    # One model version per batch: a hot reload only affects later batches
+    model = get_model()
+    return [(model.version, pred) for pred in model.predict(batch)]
+
+# Images are preprocessed into preallocated input slots and stacked into one
+# preallocated batch buffer, so serving allocates no per-image or per-batch
+# arrays. Enough slots for a batch in the model, a batch queued behind it and
+# one image per preprocessing thread; beyond that preprocessing waits.
+input_pool = InputPool(2 * PREDICT_BATCH_MAX_SIZE + PREDICT_WORKERS, PREDICT_BATCH_MAX_SIZE)
+
+# The model is loaded lazily by the registry (MODEL_PATH, INFERENCE_BACKEND).
+# Inference itself runs on the batcher's own thread.
+batcher = MicroBatcher(
+    predict_batch,
+    max_batch_size=PREDICT_BATCH_MAX_SIZE,
+    max_wait_ms=PREDICT_BATCH_MAX_WAIT_MS,
+    input_pool=input_pool,
+)
+
+preprocess_executor = ThreadPoolExecutor(PREDICT_WORKERS, thread_name_prefix="predict-preprocess")
+
+# Duplicate uploads of the same image are answered from here without decoding
+prediction_cache = PredictionCache()
+
+model_ready = threading.Event()
+
+def warm_up_model():
+    """Load the model, then trace it and run warm-up batches for every batch size the batcher can produce"""
+    batch_sizes = warmup_batch_sizes(PREDICT_BATCH_MAX_SIZE)
+    elapsed = get_model().warm_up(batch_sizes)
+    print(f"Model warm-up finished in {elapsed:.2f}s for batch sizes {batch_sizes}")
+    model_ready.set()
+
+async def run_job(job: dict, payload_path: str) -> dict:
+    with open(payload_path, 'rb') as f:
+        model_version, preds = await diagnose(f, job['digest'])
+    return format_result(model_version, preds)
+
+# Jobs are persisted under JOB_DIR; ones left unfinished by a restart run again
+job_runner = JobRunner(run_job, JOB_WORKERS, JOB_MAX_PENDING)
+
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=warm_up_model, name="model-warmup", daemon=True).start()
+    watch_model_file(warm_up_sizes=warmup_batch_sizes(PREDICT_BATCH_MAX_SIZE))
+    await job_runner.start(ready=model_ready)
+    yield
+    await job_runner.stop()
+    preprocess_executor.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(lifespan=lifespan)
+
+class InFlightLimit:
+    """Admission counter for requests on the event loop (no locking needed there)"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {'in_flight': self.in_flight, 'limit': self.limit, 'rejected': self.rejected}
+
+predict_limit = InFlightLimit(PREDICT_MAX_IN_FLIGHT)
+
+def unavailable(status_code: int, error: str):
+    return JSONResponse({'error': error}, status_code=status_code,
+                        headers={'Retry-After': str(PREDICT_RETRY_AFTER)})
+
+# /ready reports 503 until warm-up has finished so load balancers keep
+# traffic away from a cold instance.
+@app.get('/ready')
+async def ready():
+    if not model_ready.is_set():
+        return JSONResponse({'status': 'warming_up'}, status_code=503)
+    return {'status': 'ready'}
+
+@app.get('/metrics')
+async def metrics():
+    return {
+        'models': model_metrics(),
+        'prediction_cache': prediction_cache.stats(),
+        'predict_requests': predict_limit.stats(),
+        'jobs': job_runner.stats(),
+    }
+
+# Load a new model version in the background, warm it up and swap it in
+# without dropping requests. Body (optional): {"model_path": ..., "version": ...}
+@app.post('/admin/reload-model')
+async def reload_model(request: Request, x_reload_token: str = Header(None)):
+    if not MODEL_RELOAD_TOKEN or x_reload_token != MODEL_RELOAD_TOKEN:
+        return JSONResponse({'error': 'Forbidden'}, status_code=403)
+
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    body = body if isinstance(body, dict) else {}
+    reload_in_background(
+        warm_up_sizes=warmup_batch_sizes(PREDICT_BATCH_MAX_SIZE),
+        model_path=body.get('model_path'),
+        version=body.get('version'),
+    )
+    # active_version() never loads: before warm-up finishes get_model() would
+    # block the event loop for the whole model load
+    return JSONResponse({'status': 'reloading', 'active_version': active_version()}, status_code=202)
+
+def cached_prediction(digest: str):
+    """Look an upload's hash up under the active model version"""
+    model_version = get_model().version
+    return model_version, prediction_cache.get(digest, model_version)
+
+def submit_image(data):
+    """Preprocess an image into a pooled input slot and queue it on the batcher.
+
+    Submitting from the preprocessing thread means a request cancelled while
+    it waits here still hands its slot to the batcher, which releases it.
+    """
+    slot = input_pool.acquire()
+    try:
+        load_input(data, slot)
+    except BaseException:
+        input_pool.release(slot)
+        raise
+    return batcher.submit(slot)
+
+async def diagnose(data, digest: str):
+    """Return (model_version, preds) for image bytes or a file object, from the cache or the batcher"""
+    loop = asyncio.get_running_loop()
+    model_version, preds = await loop.run_in_executor(preprocess_executor, cached_prediction, digest)
+    if preds is None:
+        # Predict with your model (batched together with concurrent requests)
+        future = await loop.run_in_executor(preprocess_executor, submit_image, data)
+        model_version, preds = await asyncio.wrap_future(future)
+        # The SQLite tier can block briefly; keep it off the event loop
+        preprocess_executor.submit(prediction_cache.put, digest, model_version, preds)
+    return model_version, preds
+
+def format_result(model_version: str, preds) -> dict:
     # Convert softmax output to class label and confidence
-    pred_class_index = np.argmax(preds[0])
+    pred_class_index = int(np.argmax(preds))
     diagnosis_type = class_labels[pred_class_index]
-    confidence_score = float(preds[0][pred_class_index] * 100)
-    
-    result = {
+    confidence_score = float(preds[pred_class_index] * 100)
+
+    return {
         'diagnosis_type': diagnosis_type,
-        'confidence_score': round(confidence_score, 2)
+        'confidence_score': round(confidence_score, 2),
+        'model_version': model_version
+    }
+
+@app.post('/predict')
+async def predict(request: Request):
+    if not model_ready.is_set():
+        return unavailable(503, 'Model is warming up')
+    if not predict_limit.try_acquire():
+        return unavailable(429, 'Too many requests in flight')
+
+    try:
+        # Stream the multipart body into a size-limited spool, hashing as it arrives
+        try:
+            upload = await receive_upload(request)
+        except UploadError as e:
+            return JSONResponse({'error': e.detail}, status_code=e.status_code)
+
+        # Decoded straight from the spooled upload
+        with upload:
+            try:
+                model_version, preds = await diagnose(upload.file, upload.sha256)
+            except UnidentifiedImageError:
+                return JSONResponse({'error': 'Unsupported or corrupt image'}, status_code=400)
+    finally:
+        predict_limit.release()
+
+    return format_result(model_version, preds)
+
+def batch_items(uploads: list):
+    """Yield (filename, upload) for every uploaded image and every image inside uploaded archives"""
+    for upload in uploads:
+        if not is_archive(upload):
+            yield upload.filename, upload
+            continue
+        for member in iter_archive(upload, max_member_bytes=MAX_UPLOAD_BYTES):
+            yield member.filename, member
+
+class BatchItems:
+    """The images of a batch request, read a chunk at a time on executor threads.
+
+    close() waits for a chunk that is being read to finish before it closes
+    the archives and uploads under it.
+    """
+
+    def __init__(self, uploads: list):
+        self.uploads = uploads
+        self._items = batch_items(uploads)
+        self._lock = threading.Lock()
+
+    def next_chunk(self, max_count: int, max_bytes: int) -> list:
+        """Up to max_count images, stopping early once they add up to max_bytes"""
+        chunk, size = [], 0
+        with self._lock:
+            while len(chunk) < max_count and size < max_bytes:
+                item = next(self._items, None)
+                if item is None:
+                    break
+                chunk.append(item)
+                size += item[1].size
+        return chunk
+
+    def close(self):
+        with self._lock:
+            self._items.close()
+            for upload in self.uploads:
+                upload.close()
+
+async def diagnose_item(filename: str, upload) -> dict:
+    try:
+        model_version, preds = await diagnose(upload.file, upload.sha256)
+    except UnidentifiedImageError:
+        return {'filename': filename, 'error': 'Unsupported or corrupt image'}
+    except Exception as e:
+        return {'filename': filename, 'error': str(e)}
+    return {'filename': filename, **format_result(model_version, preds)}
+
+async def batch_results(items: BatchItems):
+    """NDJSON lines for a batch request, one chunk of up to PREDICT_BATCH_MAX_SIZE images at a time"""
+    loop = asyncio.get_running_loop()
+    count = 0
+    while True:
+        # Archive members are extracted and hashed off the event loop
+        try:
+            chunk = await loop.run_in_executor(preprocess_executor, items.next_chunk,
+                                               PREDICT_BATCH_MAX_SIZE, PREDICT_CHUNK_MAX_BYTES)
+        except UploadError as e:
+            yield json.dumps({'error': e.detail}) + '\n'
+            return
+        if not chunk:
+            return
+        count += len(chunk)
+        if count > PREDICT_BATCH_MAX_FILES:
+            yield json.dumps({'error': f'Batch exceeds {PREDICT_BATCH_MAX_FILES} images'}) + '\n'
+            return
+
+        # The whole chunk is submitted at once, so it lands in one batched forward pass
+        results = await asyncio.gather(*(diagnose_item(*item) for item in chunk))
+        for _, upload in chunk:
+            upload.close()
+        yield ''.join(json.dumps(result) + '\n' for result in results)
+
+async def finish_batch(items: BatchItems):
+    try:
+        # Blocks while a chunk is still being read, so not on the event loop
+        await asyncio.to_thread(items.close)
+    finally:
+        predict_limit.release()
+
+class CleanupStreamingResponse(StreamingResponse):
+    """StreamingResponse that awaits `cleanup()` once it is done, however it ends.
+
+    A generator's finally only runs if Starlette starts iterating it, and a
+    BackgroundTask is skipped when the client has disconnected.
+    """
+
+    def __init__(self, content, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.cleanup()
+
+# Many images in one request: multipart with any number of file fields (each
+# an image or a zip/tar of images), or a raw zip/tar body. Results stream back
+# as NDJSON, one line per image, as each batch finishes.
+@app.post('/predict/batch')
+async def predict_many(request: Request):
+    if not model_ready.is_set():
+        return unavailable(503, 'Model is warming up')
+    if not predict_limit.try_acquire():
+        return unavailable(429, 'Too many requests in flight')
+
+    try:
+        if request.headers.get('content-type', '').startswith('multipart/'):
+            uploads = await receive_uploads(request, max_files=PREDICT_BATCH_MAX_FILES,
+                                            max_bytes=PREDICT_BATCH_MAX_BYTES,
+                                            max_total_bytes=PREDICT_BATCH_MAX_BYTES)
+        else:
+            uploads = [await receive_body(request, max_bytes=PREDICT_BATCH_MAX_BYTES)]
+    except UploadError as e:
+        predict_limit.release()
+        return JSONResponse({'error': e.detail}, status_code=e.status_code)
+    except BaseException:
+        predict_limit.release()
+        raise
+
+    items = BatchItems(uploads)
+    return CleanupStreamingResponse(batch_results(items), lambda: finish_batch(items),
+                                    media_type='application/x-ndjson')
+
+def job_response(job: dict) -> dict:
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'filename': job['filename'],
+        'result': job['result'],
+        'error': job['error'],
+        'created_at': isoformat(job['created_at']),
+        'finished_at': isoformat(job['finished_at']),
     }
-    
-    return jsonify(result)
+
+def isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp else None
+
+def job_not_found():
+    return JSONResponse({'error': 'Job not found'}, status_code=404)
+
+# Asynchronous diagnosis: returns 202 with a job id right away. Follow the job
+# with GET /jobs/{id} (add ?wait=seconds to long-poll until it finishes) or
+# with server-sent events from GET /jobs/{id}/events.
+@app.post('/jobs')
+async def submit_job(request: Request):
+    if job_runner.full():
+        return unavailable(429, 'Job queue is full')
+
+    try:
+        upload = await receive_upload(request)
+    except UploadError as e:
+        return JSONResponse({'error': e.detail}, status_code=e.status_code)
+
+    with upload:
+        job = await job_runner.submit(upload.filename, upload.sha256, upload.file)
+    return JSONResponse(job_response(job), status_code=202, headers={'Location': f"/jobs/{job['job_id']}"})
+
+@app.get('/jobs/{job_id}')
+async def get_job(job_id: str, wait: float = 0):
+    wait = min(max(wait, 0), JOB_MAX_WAIT)
+    job = await job_runner.wait(job_id, wait) if wait else await job_runner.get(job_id)
+    if job is None:
+        return job_not_found()
+    return job_response(job)
+
+@app.get('/jobs/{job_id}/events')
+async def job_events(job_id: str):
+    job = await job_runner.get(job_id)
+    if job is None:
+        return job_not_found()
+
+    async def stream(job):
+        # One "status" event per change; comments keep idle proxies from closing the stream
+        yield f"event: status\ndata: {json.dumps(job_response(job))}\n\n"
+        while job['status'] not in FINISHED_STATUSES:
+            update = await job_runner.wait(job_id, JOB_EVENTS_KEEPALIVE, seen_status=job['status'])
+            if update is None:
+                return
+            if update['status'] == job['status']:
+                yield ": keep-alive\n\n"
+                continue
+            job = update
+            yield f"event: status\ndata: {json.dumps(job_response(job))}\n\n"
+
+    return StreamingResponse(stream(job), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def collect_batch(source: queue.Queue, max_size: int, max_wait: float, first_timeout=None) -> list:
+    """Block for the first item, then keep gathering until max_size items or max_wait seconds"""
+    try:
+        first = source.get(timeout=first_timeout)
+    except queue.Empty:
+        return []
+
+    batch = [first]
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(source.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-image predictions into one batched forward pass.
+
+    Callers submit one preprocessed image of shape (224, 224, 3) and get back the
+    model output row for that image. A background thread waits at most
+    `max_wait_ms` after the first queued image (or until `max_batch_size` images
+    are queued), runs `predict_fn` once on the stacked batch and fans the rows
+    back out to the waiting callers.
+
+    With `input_pool` (a preprocessing.InputPool) images must be slots acquired
+    from it: they are stacked into the pool's batch buffer and released once
+    the forward pass is done.
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int = 16, max_wait_ms: float = 10, input_pool=None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.input_pool = input_pool
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image_array: np.ndarray) -> Future:
+        """Queue one image and return a future resolving to its prediction row"""
+        future = Future()
+        self._queue.put((image_array, future))
+        return future
+
+    def predict(self, image_array: np.ndarray, timeout=None) -> np.ndarray:
+        """Queue one image and block until its prediction row is ready"""
+        return self.submit(image_array).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = collect_batch(self._queue, self.max_batch_size, self.max_wait)
+            try:
+                # Drop callers that gave up (e.g. an asyncio.wrap_future waiter that
+                # was cancelled); the rest can no longer be cancelled once running
+                self._predict([(image, future) for image, future in batch if future.set_running_or_notify_cancel()])
+            finally:
+                if self.input_pool is not None:
+                    for image, _ in batch:
+                        self.input_pool.release(image)
+
+    def _predict(self, batch: list):
+        if not batch:
+            return
+        images = [image for image, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            preds = self.predict_fn(self.input_pool.stack(images) if self.input_pool is not None else np.stack(images))
+            if len(preds) != len(futures):
+                raise ValueError(f"Model returned {len(preds)} rows for a batch of {len(futures)}")
+            for future, pred in zip(futures, preds):
+                future.set_result(pred)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
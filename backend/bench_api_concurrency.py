@@ -0,0 +1,137 @@
+"""Benchmark /user-info latency while /admin/scans is slow.
+
+Usage (from the repository root):
+    python -m backend.bench_api_concurrency [--slow-ms 2000] [--query-ms 5]
+        [--slow-clients 8] [--clients 8] [--requests 400]
+
+Starts a stand-in Supabase REST server whose every query takes --query-ms,
+except reads of the `scans` table which take --slow-ms, serves
+_DEPRECATED_main.py against it with uvicorn, and measures /user-info p50/p99
+twice: on its own, and while --slow-clients admins keep requesting
+/admin/scans. With every Supabase call off the event loop the two p99s stay
+close; a blocking call inside an async route pushes the second towards
+--slow-ms.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import jwt
+import numpy as np
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_SECRET = "bench-secret-bench-secret-bench-secret"
+
+
+def start_fake_supabase(query_ms: float, slow_ms: float) -> str:
+    """Serve just enough of PostgREST for the benchmarked routes; returns its URL"""
+    user = {"user_id": 1, "email": BENCH_EMAIL, "role": "admin", "full_name": "Bench User"}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            slow = self.path.startswith("/rest/v1/scans")
+            time.sleep((slow_ms if slow else query_ms) / 1000)
+            body = json.dumps([] if slow else [user]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def start_api(port: int):
+    # Imported only now: the API reads SUPABASE_URL / SECRET_KEY at import time
+    import uvicorn
+    from backend._DEPRECATED_main import app
+
+    # The API logs at INFO, which would log every Supabase request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+async def run_phase(url: str, token: str, clients: int, total: int, slow_clients: int) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    slow_done = 0
+    sent = 0
+    finished = asyncio.Event()
+
+    async def client(http: httpx.AsyncClient):
+        nonlocal sent
+        while sent < total:
+            sent += 1
+            started = time.perf_counter()
+            response = await http.get(f"{url}/user-info", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    async def slow_client(http: httpx.AsyncClient):
+        nonlocal slow_done
+        while not finished.is_set():
+            response = await http.get(f"{url}/admin/scans", headers=headers)
+            response.raise_for_status()
+            slow_done += 1
+
+    limits = httpx.Limits(max_connections=clients + slow_clients)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as http:
+        background = [asyncio.create_task(slow_client(http)) for _ in range(slow_clients)]
+        if slow_clients:
+            # Let the slow requests reach the stand-in database first
+            await asyncio.sleep(0.2)
+        await asyncio.gather(*(client(http) for _ in range(clients)))
+        finished.set()
+        await asyncio.gather(*background)
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "slow_done": slow_done,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that slow admin queries do not stall other requests")
+    parser.add_argument("--slow-ms", type=float, default=2000, help="latency of scans table reads")
+    parser.add_argument("--query-ms", type=float, default=5, help="latency of every other query")
+    parser.add_argument("--slow-clients", type=int, default=8, help="concurrent /admin/scans clients")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent /user-info clients")
+    parser.add_argument("--requests", type=int, default=400, help="/user-info requests per phase")
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    os.environ["SUPABASE_URL"] = start_fake_supabase(args.query_ms, args.slow_ms)
+    os.environ["SUPABASE_KEY"] = "bench.bench.bench"
+    os.environ["SECRET_KEY"] = BENCH_SECRET
+    url = start_api(args.port)
+    token = jwt.encode({"sub": BENCH_EMAIL, "user_id": 1, "role": "admin",
+                        "exp": datetime.utcnow() + timedelta(hours=1)}, BENCH_SECRET, algorithm="HS256")
+
+    print(f"{'phase':<24} {'p50 ms':>8} {'p99 ms':>8}  /admin/scans done")
+    for name, slow_clients in (("/user-info alone", 0), ("with slow /admin/scans", args.slow_clients)):
+        result = asyncio.run(run_phase(url, token, args.clients, args.requests, slow_clients))
+        print(f"{name:<24} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}  {result['slow_done']}")
+
+
+if __name__ == "__main__":
+    main()
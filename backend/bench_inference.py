@@ -0,0 +1,57 @@
+"""Benchmark per-call inference overhead: model.predict vs. direct calls.
+
+Usage:
+    python bench_inference.py [--model model.h5] [--repeats 50]
+
+For batch sizes 1, 8 and 32 reports the mean milliseconds per call for
+Keras `model.predict`, an eager `model(x, training=False)` call and the
+compiled `inference.CompiledModel.predict` used by app.py and the worker,
+plus how much of model.predict's time is per-call overhead.
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from inference import INPUT_SHAPE, CompiledModel
+from model_registry import MODEL_PATH
+
+BATCH_SIZES = (1, 8, 32)
+
+
+def time_calls(fn, batch: np.ndarray, repeats: int) -> float:
+    """Mean milliseconds per call after one untimed warm-up call"""
+    fn(batch)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn(batch)
+    return (time.perf_counter() - started) / repeats * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference call paths")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    compiled = CompiledModel(model)
+
+    paths = {
+        "model.predict": lambda batch: model.predict(batch, verbose=0),
+        "eager call": lambda batch: model(batch, training=False).numpy(),
+        "compiled call": compiled.predict,
+    }
+
+    print(f"{'batch':>5}" + "".join(f"{name:>16}" for name in paths) + f"{'overhead':>12}")
+    rng = np.random.default_rng(0)
+    for batch_size in BATCH_SIZES:
+        batch = rng.random((batch_size, *INPUT_SHAPE), dtype=np.float32)
+        timings = {name: time_calls(fn, batch, args.repeats) for name, fn in paths.items()}
+        overhead = timings["model.predict"] - timings["compiled call"]
+        print(f"{batch_size:>5}" + "".join(f"{ms:>14.2f}ms" for ms in timings.values()) + f"{overhead:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
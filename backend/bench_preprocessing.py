@@ -0,0 +1,94 @@
+"""Microbenchmark: legacy preprocess_image vs. the shared preprocessing module.
+
+Usage:
+    python bench_preprocessing.py                 # synthetic X-ray-sized images
+    python bench_preprocessing.py path/to/images  # every image in a folder
+
+Reports mean time per image and peak traced memory (tracemalloc) for the
+decode + preprocess path of each implementation.
+"""
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import load_input, preprocess_batch, decode_image
+
+
+def legacy_preprocess(data: bytes) -> np.ndarray:
+    """The original app.py path: full decode, float64 normalize, expand_dims"""
+    image = Image.open(io.BytesIO(data)).convert('RGB')
+    img = image.resize((224, 224))
+    img_array = np.array(img) / 255.0
+    if img_array.shape[-1] != 3:
+        img_array = np.stack((img_array,) * 3, axis=-1)
+    return np.expand_dims(img_array, axis=0)
+
+
+def synthetic_samples() -> dict:
+    """Encode a few chest X-ray sized images in the formats we receive"""
+    rng = np.random.default_rng(0)
+    gray = rng.integers(0, 256, size=(2500, 2048), dtype=np.uint8)
+    samples = {}
+    for name, image, fmt in (
+        ("jpeg-gray-2048x2500", Image.fromarray(gray), "JPEG"),
+        ("jpeg-rgb-2048x2500", Image.fromarray(gray).convert("RGB"), "JPEG"),
+        ("png-gray-2048x2500", Image.fromarray(gray), "PNG"),
+        ("png-rgba-1024x1024", Image.fromarray(gray[:1024, :1024]).convert("RGBA"), "PNG"),
+    ):
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, quality=90)
+        samples[name] = buffer.getvalue()
+    return samples
+
+
+def folder_samples(folder: str) -> dict:
+    return {path.name: path.read_bytes() for path in sorted(Path(folder).iterdir()) if path.is_file()}
+
+
+def measure(fn, data: bytes, repeats: int) -> tuple:
+    """Return (mean seconds per call, peak traced bytes of a single call)"""
+    fn(data)  # warm up codecs and caches
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn(data)
+    elapsed = (time.perf_counter() - started) / repeats
+
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    samples = folder_samples(sys.argv[1]) if len(sys.argv) > 1 else synthetic_samples()
+    repeats = 10
+    out = np.empty((224, 224, 3), dtype=np.float32)
+
+    print(f"{'image':<28}{'legacy ms':>11}{'new ms':>9}{'legacy MB':>11}{'new MB':>9}{'max |diff|':>12}")
+    for name, data in samples.items():
+        legacy_time, legacy_peak = measure(legacy_preprocess, data, repeats)
+        new_time, new_peak = measure(lambda d: load_input(d, out), data, repeats)
+        diff = np.abs(legacy_preprocess(data)[0] - load_input(data)).max()
+        print(
+            f"{name:<28}{legacy_time * 1e3:>11.2f}{new_time * 1e3:>9.2f}"
+            f"{legacy_peak / 2**20:>11.2f}{new_peak / 2**20:>9.2f}{diff:>12.4f}"
+        )
+
+    # Batch path: decode everything straight into one preallocated buffer
+    images = list(samples.values())
+    batch = np.empty((len(images), 224, 224, 3), dtype=np.float32)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        preprocess_batch([decode_image(data) for data in images], batch)
+    per_image = (time.perf_counter() - started) / (repeats * len(images))
+    print(f"\npreprocess_batch into a preallocated buffer: {per_image * 1e3:.2f} ms/image")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Check that the ONNX / TFLite backends agree with the TensorFlow model.
+
+Usage:
+    python check_backend_parity.py path/to/fixture/scans [--model model.h5]
+        [--backends onnx tflite] [--min-agreement 1.0] [--max-delta 1.0]
+
+Runs every image in the folder through TensorFlow and each converted
+backend and reports class agreement and confidence deltas (in percentage
+points, the unit stored in confidence_score). Exits non-zero if any backend
+is below --min-agreement or exceeds --max-delta.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from inference import load_backend
+from model_registry import MODEL_PATH
+from preprocessing import load_input
+
+CLASS_LABELS = ['pneumonia', 'normal', 'lung_cancer']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends against TensorFlow")
+    parser.add_argument("folder", help="folder of fixture scans")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--backends", nargs="+", default=["onnx", "tflite"])
+    parser.add_argument("--min-agreement", type=float, default=1.0)
+    parser.add_argument("--max-delta", type=float, default=1.0,
+                        help="largest allowed confidence difference in percentage points")
+    args = parser.parse_args()
+
+    paths = [path for path in sorted(Path(args.folder).iterdir()) if path.is_file()]
+    if not paths:
+        sys.exit(f"No images found in {args.folder}")
+    batch = np.stack([load_input(path.read_bytes()) for path in paths])
+
+    # variant is explicit: with MODEL_VARIANT=int8 in the environment every
+    # backend would otherwise load the quantized TFLite model
+    reference = load_backend(args.model, "tensorflow", variant="float32").predict(batch)
+    reference_classes = reference.argmax(axis=1)
+
+    passed = True
+    for backend in args.backends:
+        preds = load_backend(args.model, backend, variant="float32").predict(batch)
+        classes = preds.argmax(axis=1)
+        deltas = np.abs(preds - reference).max(axis=1) * 100
+        agreement = float((classes == reference_classes).mean())
+
+        for path, expected, actual in zip(paths, reference_classes, classes):
+            if expected != actual:
+                print(f"[{backend}] MISMATCH {path.name}: tensorflow={CLASS_LABELS[expected]} {backend}={CLASS_LABELS[actual]}")
+
+        ok = agreement >= args.min_agreement and deltas.max() <= args.max_delta
+        passed = passed and ok
+        print(f"[{backend}] {'PASS' if ok else 'FAIL'}: {len(paths)} images, class agreement {agreement:.2%}, "
+              f"confidence delta mean {deltas.mean():.3f} / max {deltas.max():.3f} points")
+
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
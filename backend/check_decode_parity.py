@@ -0,0 +1,65 @@
+"""Check that fast decoding (and high-bit-depth windowing) does not change predictions.
+
+Usage:
+    python check_decode_parity.py path/to/sample/scans [--model model.h5] [--min-agreement 0.99] [--window]
+
+Runs every image in the folder through the model twice: once with the legacy
+path (full decode, 16-bit scans converted to RGB) and once with the fast path
+(JPEG draft + reduced resize). With --window the fast path also windows
+16/32-bit scans to their own value range, as PREPROCESS_WINDOW_HIGH_BIT_DEPTH=1
+does. Reports class agreement and the largest confidence delta, and exits
+non-zero when agreement is below --min-agreement.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+from model_registry import MODEL_PATH
+from preprocessing import WINDOW_HIGH_BIT_DEPTH, load_input
+
+CLASS_LABELS = ['pneumonia', 'normal', 'lung_cancer']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fast vs. full image decoding")
+    parser.add_argument("folder", help="folder of sample scans")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--window", action="store_true", default=WINDOW_HIGH_BIT_DEPTH,
+                        help="window 16/32-bit scans on the fast path (default: PREPROCESS_WINDOW_HIGH_BIT_DEPTH)")
+    args = parser.parse_args()
+
+    paths = [path for path in sorted(Path(args.folder).iterdir()) if path.is_file()]
+    if not paths:
+        sys.exit(f"No images found in {args.folder}")
+
+    full, fast = [], []
+    for path in paths:
+        data = path.read_bytes()
+        full.append(load_input(data, fast=False, window=False))
+        fast.append(load_input(data, fast=True, window=args.window))
+
+    model = tf.keras.models.load_model(args.model)
+    full_preds = model.predict(np.stack(full), verbose=0)
+    fast_preds = model.predict(np.stack(fast), verbose=0)
+
+    full_classes = full_preds.argmax(axis=1)
+    fast_classes = fast_preds.argmax(axis=1)
+    deltas = np.abs(full_preds - fast_preds).max(axis=1) * 100
+
+    for path, full_class, fast_class, delta in zip(paths, full_classes, fast_classes, deltas):
+        if full_class != fast_class:
+            print(f"MISMATCH {path.name}: full={CLASS_LABELS[full_class]} fast={CLASS_LABELS[fast_class]}")
+
+    agreement = float((full_classes == fast_classes).mean())
+    print(f"{len(paths)} images, class agreement {agreement:.2%}, "
+          f"confidence delta mean {deltas.mean():.3f} / max {deltas.max():.3f} points")
+    if agreement < args.min_agreement:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,27 @@
+import argparse
 import time
-import io
+import multiprocessing as mp
+import os
+import queue
+import signal
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait as wait_connections
 import numpy as np
-from PIL import Image
-import tensorflow as tf
-from supabase import create_client, Client
-import requests
+from postgrest.exceptions import APIError
+from supabase import Client
+from batching import collect_batch
+from http_pool import create_supabase_client, http_pool
+from inference import INFERENCE_BACKEND, MODEL_VARIANT, warmup_batch_sizes
+from model_registry import active_version, get_model, preload, reload_in_background, watch_model_file
+from prediction_cache import PredictionCache, image_digest
+from preprocessing import InputPool, load_input
+from scan_intake import RealtimeScanIntake
+from scheduler import PRIORITIES, ScanScheduler
+from storage_fetch import StorageFetcher
+from write_buffer import WriteBehindBuffer
 
 # === CONFIGURATION ===
 SUPABASE_URL = "https://cuidgtbjhqojmcdvnyue.supabase.co"
@@ -12,49 +29,103 @@ SUPABASE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZSIsInJ
 
 BUCKET_NAME = "medical-scans"
 PENDING_STATUS = "pending"
+PROCESSING_STATUS = "processing"
 COMPLETED_STATUS = "completed"
 FAILED_STATUS = "failed"
 
+# Batched inference: prepared scans are diagnosed together with a single model
+# call once the batch is full or the oldest prepared scan has waited
+# BATCH_MAX_WAIT seconds.
+BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "16"))
+BATCH_MAX_WAIT = float(os.getenv("WORKER_BATCH_MAX_WAIT", "5"))
+
+# Download pipeline: DOWNLOAD_CONCURRENCY threads fetch scans while
+# PREPROCESS_WORKERS threads decode them, so network I/O overlaps inference.
+# At most MAX_IN_FLIGHT scans are held in memory between download and inference.
+DOWNLOAD_CONCURRENCY = int(os.getenv("WORKER_DOWNLOAD_CONCURRENCY", "8"))
+PREPROCESS_WORKERS = int(os.getenv("WORKER_PREPROCESS_WORKERS", "2"))
+MAX_IN_FLIGHT = int(os.getenv("WORKER_MAX_IN_FLIGHT", str(2 * BATCH_SIZE)))
+
+# Job intake: "realtime" reacts to inserts on `scans` as they happen and only
+# polls every RECONCILE_INTERVAL seconds to catch missed events; "poll" selects
+# pending scans every poll_interval seconds. Events arriving within
+# INTAKE_WINDOW seconds of each other are handed to the pipeline together.
+INTAKE_MODE = os.getenv("WORKER_INTAKE_MODE", "realtime")
+RECONCILE_INTERVAL = float(os.getenv("WORKER_RECONCILE_INTERVAL", "300"))
+INTAKE_WINDOW = float(os.getenv("WORKER_INTAKE_WINDOW", "0.05"))
+
+# Process pool mode (--processes N): the supervisor waits up to
+# CHILD_SHUTDOWN_TIMEOUT seconds for children to finish their current chunk on
+# shutdown and prints per-child throughput every POOL_STATS_INTERVAL seconds.
+CHILD_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_CHILD_SHUTDOWN_TIMEOUT", "120"))
+POOL_STATS_INTERVAL = float(os.getenv("WORKER_POOL_STATS_INTERVAL", "60"))
+# "spawn" starts every child from a fresh interpreter that loads its own model.
+# "fork" (POSIX, TFLite only) preloads the model in the supervisor so children
+# share its read-only weights through copy-on-write. Forked children (including
+# restarts forked from the multi-threaded supervisor) open their own HTTP and
+# prediction cache connections; see the fork hooks in http_pool and prediction_cache.
+POOL_START_METHOD = os.getenv("WORKER_START_METHOD", "spawn")
+
+# Job claiming: scans are claimed in chunks of CLAIM_BATCH_SIZE by moving them
+# to `processing` with this worker's id and a lease. A chunk must finish within
+# LEASE_SECONDS; after that other workers may reclaim it (e.g. after a crash).
+# Requires the columns in sql/scan_leases.sql.
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "300"))
+CLAIM_BATCH_SIZE = int(os.getenv("WORKER_CLAIM_BATCH_SIZE", str(MAX_IN_FLIGHT)))
+
+# Scheduling: candidate scans are ordered by priority (urgent / normal / bulk)
+# and shared round-robin between uploading users before they are claimed. A
+# scan's priority is scans.priority when set (sql/scan_priority.sql); otherwise
+# scan types in WORKER_URGENT_SCAN_TYPES and users on a plan in
+# WORKER_URGENT_PLANS are urgent and everything else is normal. Queue depth and
+# wait times per priority are printed every SCHEDULER_STATS_INTERVAL seconds.
+URGENT_SCAN_TYPES = set(filter(None, os.getenv("WORKER_URGENT_SCAN_TYPES", "").split(",")))
+URGENT_PLANS = set(filter(None, os.getenv("WORKER_URGENT_PLANS", "premium").split(",")))
+SCHEDULER_STATS_INTERVAL = float(os.getenv("WORKER_SCHEDULER_STATS_INTERVAL", "60"))
+USER_PLAN_TTL = 300
+
+# Result write-back: completed / failed scans are buffered and written in bulk
+# through the record_scan_results RPC (sql/record_scan_results.sql) once
+# WRITE_BATCH_SIZE results are pending or the oldest has waited WRITE_MAX_DELAY
+# seconds, and on shutdown.
+WRITE_BATCH_SIZE = int(os.getenv("WORKER_WRITE_BATCH_SIZE", "100"))
+WRITE_MAX_DELAY = float(os.getenv("WORKER_WRITE_MAX_DELAY", "1"))
+
+# Scan downloads: "direct" fetches each object from the authenticated storage
+# endpoint in a single request; "signed" signs a whole batch's paths with one
+# call before downloading. Downloads, table and storage calls all share the
+# keep-alive (HTTP/2) connections of http_pool (SUPABASE_HTTP_* settings).
+STORAGE_FETCH_MODE = os.getenv("WORKER_STORAGE_FETCH", "direct")
+DOWNLOAD_TIMEOUT = float(os.getenv("WORKER_DOWNLOAD_TIMEOUT", "15"))
+
 # Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = create_supabase_client(SUPABASE_URL, SUPABASE_KEY)
+
+storage_fetcher = StorageFetcher(
+    SUPABASE_URL, SUPABASE_KEY, BUCKET_NAME, storage=supabase.storage,
+    mode=STORAGE_FETCH_MODE, timeout=DOWNLOAD_TIMEOUT,
+)
+
+# Set PREDICTION_CACHE_DB to share cached predictions between pool children
+prediction_cache = PredictionCache()
+
+# Scans are preprocessed into preallocated input slots and stacked into one
+# preallocated batch buffer: MAX_IN_FLIGHT slots for scans between download and
+# inference plus a batch being diagnosed. Extra scans wait for a free slot.
+input_pool = InputPool(MAX_IN_FLIGHT + BATCH_SIZE, BATCH_SIZE)
 
-# Load your trained model
-MODEL_PATH = r"C:\Users\Informatics\Desktop\model.h5"
-model = tf.keras.models.load_model(MODEL_PATH)
-print("Model loaded successfully")
+# The trained model is loaded lazily by model_registry on the first batch
+# (MODEL_PATH, INFERENCE_BACKEND). The TensorFlow backend calls the model
+# directly under a traced tf.function; model.predict builds a data adapter and
+# iterator on every call, which dominates small batches.
 
 CLASS_LABELS = ['pneumonia', 'normal', 'lung_cancer']
 
-def preprocess_image(image: Image.Image) -> np.ndarray:
-    """Preprocess image for model prediction"""
-    img = image.resize((224, 224))
-    img_array = np.array(img) / 255.0
-    
-    # Ensure 3 channels (RGB)
-    if len(img_array.shape) == 2 or img_array.shape[-1] == 1:
-        img_array = np.stack((img_array,) * 3, axis=-1)
-    elif img_array.shape[-1] == 4:  # RGBA case
-        img_array = img_array[..., :3]
-    
-    return np.expand_dims(img_array, axis=0)
-
-def download_scan_file(file_path: str) -> Image.Image:
-    """Download scan file from Supabase Storage"""
+def download_scan_bytes(file_path: str) -> bytes:
+    """Download raw scan bytes from Supabase Storage"""
     try:
-        # Get signed URL response
-        signed_url_response = supabase.storage.from_(BUCKET_NAME).create_signed_url(file_path, 1800)
-        
-        # Extract the URL from the response
-        signed_url = signed_url_response.get('signedURL') or signed_url_response.get('signedUrl')
-        if not signed_url:
-            raise Exception("No valid signed URL found in response")
-        
-        # Download the image
-        response = requests.get(signed_url, timeout=15)
-        response.raise_for_status()
-        
-        return Image.open(io.BytesIO(response.content)).convert('RGB')
-        
+        return storage_fetcher.fetch(file_path)
     except Exception as e:
         print(f"Failed to download file {file_path}: {str(e)}")
         raise
@@ -63,46 +134,602 @@ def update_scan_record(scan_id: str, updates: dict):
     """Update scan record in database"""
     supabase.table("scans").update(updates).eq("scan_id", scan_id).execute()
 
+def utc_timestamp(offset_seconds: float = 0) -> str:
+    """ISO-8601 UTC timestamp, optionally offset into the future"""
+    moment = datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)
+    return moment.isoformat(timespec="seconds").replace("+00:00", "Z")
+
+def claimable_filter() -> str:
+    """PostgREST `or` filter matching pending scans and scans with an expired lease"""
+    return (
+        f"diagnosis_status.eq.{PENDING_STATUS},"
+        f"and(diagnosis_status.eq.{PROCESSING_STATUS},lease_expires_at.lt.{utc_timestamp()})"
+    )
+
+def claim_scans(scans: list) -> list:
+    """Atomically claim scans for this worker and return the ones it won.
+
+    The update only matches rows that are still claimable, so when several
+    workers race for the same scans each row goes to exactly one of them.
+    """
+    if not scans:
+        return []
+    response = supabase.table("scans").update({
+        "diagnosis_status": PROCESSING_STATUS,
+        "worker_id": WORKER_ID,
+        "lease_expires_at": utc_timestamp(LEASE_SECONDS)
+    }).in_("scan_id", [scan["scan_id"] for scan in scans]).or_(claimable_filter()).execute()
+    # Keep the caller's (scheduling) order rather than the order rows come back in
+    won = {row["scan_id"]: row for row in response.data or []}
+    return [{"scan_id": scan["scan_id"], "file_path": won[scan["scan_id"]]["file_path"]}
+            for scan in scans if scan["scan_id"] in won]
+
+_results_rpc_available = True
+
+def write_results(rows: list):
+    """Write a batch of scan results: one RPC call, or grouped updates without the RPC"""
+    global _results_rpc_available
+    if _results_rpc_available:
+        try:
+            supabase.rpc("record_scan_results", {"results": rows}).execute()
+            print(f"Wrote {len(rows)} scan results")
+            return
+        except APIError as e:
+            if e.code != "PGRST202":
+                raise
+            print("record_scan_results not found (see sql/record_scan_results.sql), writing results one by one")
+            _results_rpc_available = False
+
+    # All failures share one update; each completed scan has its own values
+    failed = [row["scan_id"] for row in rows if row["diagnosis_status"] == FAILED_STATUS]
+    if failed:
+        supabase.table("scans").update({
+            "diagnosis_status": FAILED_STATUS,
+            "lease_expires_at": None
+        }).in_("scan_id", failed).execute()
+    for row in rows:
+        if row["diagnosis_status"] != FAILED_STATUS:
+            update_scan_record(row["scan_id"], {**{k: v for k, v in row.items() if k != "scan_id"}, "lease_expires_at": None})
+    print(f"Wrote {len(rows)} scan results")
+
+# Updates are idempotent, so a flush that fails part-way is simply retried
+result_writer = WriteBehindBuffer(write_results, WRITE_BATCH_SIZE, WRITE_MAX_DELAY, name="scan-results")
+
+def record_prediction(scan_id: str, pred: np.ndarray, model_version: str):
+    """Queue a single prediction row for write-back to its scan record"""
+    pred_index = np.argmax(pred)
+    result_writer.add(scan_id, {
+        "scan_id": scan_id,
+        "diagnosis_type": CLASS_LABELS[pred_index],
+        "confidence_score": float(pred[pred_index] * 100),
+        "diagnosis_status": COMPLETED_STATUS,
+        "model_version": model_version
+    })
+    print(f"Completed diagnosis for scan {scan_id}")
+
+def mark_failed(scan_id: str, error: Exception):
+    """Mark a single scan as failed without affecting the rest of its batch"""
+    print(f"Failed to diagnose scan {scan_id}: {str(error)}")
+    result_writer.add(scan_id, {"scan_id": scan_id, "diagnosis_status": FAILED_STATUS})
+
+def preprocess_stage(scan: dict, digest: str, data: bytes, prepared: queue.Queue):
+    """Decode and preprocess downloaded bytes, handing the result to the inference stage"""
+    input_array = input_pool.acquire()
+    try:
+        load_input(data, input_array)
+    except Exception as e:
+        input_pool.release(input_array)
+        mark_failed(scan["scan_id"], e)
+        input_array = None
+    prepared.put((scan["scan_id"], digest, input_array))
+
+def download_stage(scan: dict, preprocess_pool: ThreadPoolExecutor, prepared: queue.Queue):
+    """Download one scan and pass it on to the preprocessing pool"""
+    try:
+        data = download_scan_bytes(scan["file_path"])
+    except Exception as e:
+        mark_failed(scan["scan_id"], e)
+        prepared.put((scan["scan_id"], None, None))
+        return
+
+    # Every scan puts exactly one item on `prepared` (here or in
+    # preprocess_stage), or diagnose_scans would wait for it forever
+    digest = None
+    try:
+        # A re-uploaded image already diagnosed by this model version skips
+        # decoding and inference. active_version() never loads the model, so
+        # scans arriving before the first batch has loaded it skip the cache.
+        digest = image_digest(data)
+        version = active_version()
+        pred = prediction_cache.get(digest, version) if version is not None else None
+        if pred is None:
+            preprocess_pool.submit(preprocess_stage, scan, digest, data, prepared)
+            return
+        record_prediction(scan["scan_id"], pred, version)
+    except Exception as e:
+        mark_failed(scan["scan_id"], e)
+    prepared.put((scan["scan_id"], digest, None))
+
+def diagnose_batch(batch: list):
+    """Run one model call over a list of (scan_id, digest, input_array) items and write back results"""
+    print(f"Diagnosing batch of {len(batch)} scans...")
+    # One model version per batch: a hot reload only affects later batches
+    try:
+        model = get_model()
+    except Exception as e:
+        # Not the scans' fault (e.g. a bad MODEL_PATH during a reload): hand them
+        # back to pending for a later attempt; loading is retried with the next batch
+        print(f"Model failed to load: {str(e)}")
+        release_scans([scan_id for scan_id, _, _ in batch])
+        return
+    try:
+        preds = model.predict(input_pool.stack([x for _, _, x in batch]))
+    except Exception as e:
+        # Don't let one bad input fail the whole batch: retry each scan on its own
+        print(f"Batch prediction failed, retrying scans individually: {str(e)}")
+        for scan_id, digest, x in batch:
+            try:
+                pred = model.predict(x[np.newaxis])[0]
+                prediction_cache.put(digest, model.version, pred)
+                record_prediction(scan_id, pred, model.version)
+            except Exception as scan_error:
+                mark_failed(scan_id, scan_error)
+        return
+
+    for (scan_id, digest, _), pred in zip(batch, preds):
+        prediction_cache.put(digest, model.version, pred)
+        try:
+            record_prediction(scan_id, pred, model.version)
+        except Exception as e:
+            mark_failed(scan_id, e)
+
+def diagnose_scans(
+    scans: list,
+    batch_size: int = BATCH_SIZE,
+    batch_max_wait: float = BATCH_MAX_WAIT,
+    download_concurrency: int = DOWNLOAD_CONCURRENCY,
+    max_in_flight: int = MAX_IN_FLIGHT,
+):
+    """Download, preprocess and diagnose scans as a pipeline, batching the inference stage.
+
+    Every scan produces exactly one (scan_id, digest, input_array) item on the
+    prepared queue; input_array is None when the scan was already settled
+    upstream (failed, or answered from the prediction cache). A scan
+    holds an in-flight slot from the moment its download is scheduled until the
+    inference stage picks it up, which bounds memory to max_in_flight scans.
+    """
+    if not scans:
+        return
+
+    try:
+        # One signing call for the whole run in signed mode
+        storage_fetcher.prepare([scan["file_path"] for scan in scans])
+    except Exception as e:
+        print(f"Failed to sign scan URLs in bulk, signing one by one: {str(e)}")
+
+    prepared = queue.Queue()
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    with ThreadPoolExecutor(download_concurrency, thread_name_prefix="scan-download") as download_pool, \
+            ThreadPoolExecutor(PREPROCESS_WORKERS, thread_name_prefix="scan-preprocess") as preprocess_pool:
+
+        def feed():
+            for scan in scans:
+                in_flight.acquire()
+                download_pool.submit(download_stage, scan, preprocess_pool, prepared)
+
+        threading.Thread(target=feed, name="scan-feeder", daemon=True).start()
+
+        remaining = len(scans)
+        while remaining:
+            items = collect_batch(prepared, min(batch_size, remaining), batch_max_wait)
+            remaining -= len(items)
+            for _ in items:
+                in_flight.release()
+
+            batch = [item for item in items if item[2] is not None]
+            if batch:
+                try:
+                    diagnose_batch(batch)
+                finally:
+                    for _, _, input_array in batch:
+                        input_pool.release(input_array)
+
+    stats = prediction_cache.stats()
+    if stats["hits"]:
+        print(f"Prediction cache hit rate {stats['hit_rate']:.1%} "
+              f"({stats['hits']} of {stats['hits'] + stats['misses']} lookups)")
+    print_http_stats()
+
+def print_http_stats():
+    stats = http_pool.stats()
+    if stats["requests"]:
+        print(f"Supabase HTTP: {stats['requests']} requests on {stats['new_connections']} connections "
+              f"(reuse {stats['reuse_ratio']:.1%}), pool wait p50 {stats['pool_wait_p50_ms']:.1f}ms / "
+              f"p95 {stats['pool_wait_p95_ms']:.1f}ms, {stats['pool_timeouts']} pool timeouts")
+
+def diagnose_claimed(scans: list, batch_size: int = BATCH_SIZE, batch_max_wait: float = BATCH_MAX_WAIT):
+    """Claim scans chunk by chunk and diagnose the ones this worker won"""
+    for start in range(0, len(scans), CLAIM_BATCH_SIZE):
+        claimed = claim_scans(scans[start:start + CLAIM_BATCH_SIZE])
+        if claimed:
+            print(f"Claimed {len(claimed)} scans as {WORKER_ID}")
+            diagnose_scans(claimed, batch_size, batch_max_wait)
+
 def diagnose_scan(scan_id: str, file_path: str):
     """Process a single scan through the diagnosis pipeline"""
-    print(f"Diagnosing scan {scan_id}...")
+    diagnose_scans([{"scan_id": scan_id, "file_path": file_path}], batch_size=1, download_concurrency=1)
+    result_writer.flush()
+
+_priority_column_available = True
+
+def fetch_pending_scans() -> list:
+    """Select every scan still waiting for a diagnosis, including expired leases"""
+    global _priority_column_available
+    if _priority_column_available:
+        try:
+            response = supabase.from_("scans").select(
+                "scan_id,file_path,user_id,scan_type,priority"
+            ).or_(claimable_filter()).execute()
+            return response.data if response.data else []
+        except APIError as e:
+            # 42703: undefined column
+            if e.code != "42703":
+                raise
+            print("scans.priority not found (see sql/scan_priority.sql), deriving every scan's priority")
+            _priority_column_available = False
+
+    response = supabase.from_("scans").select(
+        "scan_id,file_path,user_id,scan_type"
+    ).or_(claimable_filter()).execute()
+    return response.data if response.data else []
+
+def drain_queue(source: queue.Queue) -> list:
+    """Take everything currently waiting on a queue without blocking"""
+    items = []
+    while True:
+        try:
+            items.append(source.get_nowait())
+        except queue.Empty:
+            return items
+
+def intake_scans(poll_interval: float, batch_size: int, intake_mode: str):
+    """Yield lists of candidate scans from realtime events and the (reconcile) poll"""
+    intake = queue.Queue()
+    if intake_mode == "realtime":
+        RealtimeScanIntake(SUPABASE_URL, SUPABASE_KEY, intake, PENDING_STATUS).start()
+        # Polling is only a fallback reconciler once pushes are flowing
+        poll_interval = RECONCILE_INTERVAL
+
+    next_poll = time.monotonic()
+    while True:
+        wait = max(0.0, next_poll - time.monotonic())
+        scans = collect_batch(intake, batch_size, INTAKE_WINDOW, first_timeout=wait)
+
+        if time.monotonic() >= next_poll:
+            next_poll = time.monotonic() + poll_interval
+            try:
+                # Get pending scans
+                pending = fetch_pending_scans()
+                print(f"Found {len(pending)} scans to process")
+            except Exception as e:
+                print(f"Worker error: {str(e)}")
+                pending = []
+            # Pending rows may also be queued as events; keep one of each
+            scans = list({scan["scan_id"]: scan for scan in scans + drain_queue(intake) + pending}.values())
+
+        if scans:
+            yield scans
+
+_user_plans = {}  # user_id -> (subscription_plan, fetched_at)
+
+def user_plans(user_ids: set) -> dict:
+    """subscription_plan per user, cached for USER_PLAN_TTL seconds"""
+    now = time.monotonic()
+    missing = [user_id for user_id in user_ids
+               if user_id not in _user_plans or now - _user_plans[user_id][1] > USER_PLAN_TTL]
+    if missing:
+        try:
+            response = supabase.table("users").select("user_id,subscription_plan").in_("user_id", missing).execute()
+            for row in response.data or []:
+                _user_plans[row["user_id"]] = (row.get("subscription_plan"), now)
+        except Exception as e:
+            # Schedule with the plans we already know rather than not at all
+            print(f"Failed to fetch subscription plans: {str(e)}")
+    return {user_id: _user_plans[user_id][0] for user_id in user_ids if user_id in _user_plans}
+
+def prioritize(scans: list) -> list:
+    """Set each scan's scheduling priority and tenant (its uploading user)"""
+    plans = user_plans({scan["user_id"] for scan in scans if scan.get("user_id") is not None})
+    for scan in scans:
+        scan["tenant"] = scan.get("user_id")
+        if scan.get("priority") not in PRIORITIES:
+            urgent = scan.get("scan_type") in URGENT_SCAN_TYPES or plans.get(scan["tenant"]) in URGENT_PLANS
+            scan["priority"] = "urgent" if urgent else "normal"
+    return scans
+
+def start_intake(scheduler: ScanScheduler, poll_interval: float, batch_size: int, intake_mode: str):
+    """Feed candidate scans from intake_scans into the scheduler on a background thread"""
+    def run():
+        for scans in intake_scans(poll_interval, batch_size, intake_mode):
+            scheduler.add(prioritize(scans))
+
+    thread = threading.Thread(target=run, name="scan-scheduler-feed", daemon=True)
+    thread.start()
+    return thread
+
+def print_scheduler_stats(scheduler: ScanScheduler):
+    for priority, stats in scheduler.stats().items():
+        waits = (f"wait p50 {stats['wait_p50']:.1f}s / p95 {stats['wait_p95']:.1f}s / max {stats['wait_max']:.1f}s"
+                 if stats["taken"] else "no scans taken yet")
+        print(f"Queue {priority}: depth {stats['depth']} from {stats['tenants']} users, "
+              f"{stats['taken']} taken, {waits}")
+
+def scheduled_scans(scheduler: ScanScheduler, count: int):
+    """Yield chunks of up to `count` scans in scheduling order, printing queue stats periodically"""
+    next_stats = time.monotonic() + SCHEDULER_STATS_INTERVAL
+    while True:
+        scans = scheduler.take(count, timeout=SCHEDULER_STATS_INTERVAL)
+        if time.monotonic() >= next_stats:
+            next_stats = time.monotonic() + SCHEDULER_STATS_INTERVAL
+            print_scheduler_stats(scheduler)
+        if scans:
+            yield scans
+
+def enable_model_reload(batch_size: int = BATCH_SIZE):
+    """Hot-reload the model on SIGHUP and, with MODEL_WATCH_INTERVAL set, when its file changes"""
+    warm_up_sizes = warmup_batch_sizes(batch_size)
+    watch_model_file(warm_up_sizes=warm_up_sizes)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_in_background(warm_up_sizes=warm_up_sizes))
+
+def run_worker(poll_interval=60, batch_size=BATCH_SIZE, batch_max_wait=BATCH_MAX_WAIT, intake_mode=INTAKE_MODE):
+    """Main worker loop"""
+    print(f"Diagnosis worker running ({intake_mode} intake)...")
+    enable_model_reload(batch_size)
+    scheduler = ScanScheduler()
+    start_intake(scheduler, poll_interval, batch_size, intake_mode)
+
+    def request_shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, request_shutdown)
     try:
-        img = download_scan_file(file_path)
-        input_array = preprocess_image(img)
-        preds = model.predict(input_array)
-        pred_index = np.argmax(preds[0])
-        
-        update_scan_record(scan_id, {
-            "diagnosis_type": CLASS_LABELS[pred_index],
-            "confidence_score": float(preds[0][pred_index] * 100),
-            "diagnosis_status": COMPLETED_STATUS
-        })
-        print(f"Completed diagnosis for scan {scan_id}")
-        
+        # One claim chunk at a time, so newly arrived urgent scans and other users
+        # get their turn before the rest of a large backlog
+        for scans in scheduled_scans(scheduler, CLAIM_BATCH_SIZE):
+            try:
+                diagnose_claimed(scans, batch_size, batch_max_wait)
+            except Exception as e:
+                print(f"Worker error: {str(e)}")
+                time.sleep(1)
+    except KeyboardInterrupt:
+        print("Shutting down worker...")
+    finally:
+        # Buffered results must reach the database before their leases are given up
+        result_writer.close()
+
+def release_scans(scan_ids: list):
+    """Hand claimed scans that will not be finished back to the pending pool"""
+    if not scan_ids:
+        return
+    try:
+        supabase.table("scans").update({
+            "diagnosis_status": PENDING_STATUS,
+            "worker_id": None,
+            "lease_expires_at": None
+        }).in_("scan_id", scan_ids).eq("diagnosis_status", PROCESSING_STATUS).eq("worker_id", WORKER_ID).execute()
+        print(f"Released {len(scan_ids)} unfinished scans")
     except Exception as e:
-        print(f"Failed to diagnose scan {scan_id}: {str(e)}")
-        update_scan_record(scan_id, {"diagnosis_status": FAILED_STATUS})
+        # Their leases will expire and another worker will reclaim them
+        print(f"Failed to release scans {scan_ids}: {str(e)}")
 
-def run_worker(poll_interval=60):
-    """Main worker loop"""
-    print("Diagnosis worker running...")
+def pool_child(index: int, tasks, results):
+    """Inference child: diagnose chunks of claimed scans sent by the supervisor over `tasks` (a pipe)"""
+    # Ctrl+C reaches the whole process group; only the supervisor decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    enable_model_reload()
     while True:
+        scans = tasks.recv()
+        if scans is None:
+            break
+        started = time.monotonic()
         try:
-            # Get pending scans
-            response = supabase.from_("scans").select(
-                "scan_id,file_path"
-            ).eq("diagnosis_status", PENDING_STATUS).execute()
-            
-            scans = response.data if response.data else []
-            print(f"Found {len(scans)} scans to process")
-            
-            for scan in scans:
-                diagnose_scan(scan["scan_id"], scan["file_path"])
-                
+            diagnose_scans(scans)
         except Exception as e:
-            print(f"Worker error: {str(e)}")
-        
-        time.sleep(poll_interval)
+            print(f"Child {index} error: {str(e)}")
+        results.send((len(scans), time.monotonic() - started))
+    # Scans whose results are lost if this never runs (child killed) keep their
+    # leases and are diagnosed again once those expire
+    result_writer.close()
+
+def run_pool(processes: int, intra_op_threads: int = None, poll_interval=60,
+             batch_size=BATCH_SIZE, intake_mode=INTAKE_MODE):
+    """Supervisor loop: claim scans and dispatch them to N inference child processes.
+
+    By default each child is a spawned interpreter that loads its own copy of
+    the model with the inference runtime pinned to `intra_op_threads` threads;
+    with WORKER_START_METHOD=fork children inherit the supervisor's preloaded
+    model instead. Children that die
+    are restarted and the scans they were working on are released back to
+    pending. SIGINT/SIGTERM stops intake, lets children finish their current
+    chunk and releases everything that was claimed but not started.
+    """
+    intra_op_threads = intra_op_threads or max(1, (os.cpu_count() or 1) // processes)
+    # Read by TensorFlow when each child initializes its runtime
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_op_threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+    # Read by the ONNX Runtime and TFLite backends
+    os.environ["INFERENCE_THREADS"] = str(intra_op_threads)
+
+    if POOL_START_METHOD == "fork":
+        # TensorFlow and ONNX Runtime thread pools do not survive a fork
+        if MODEL_VARIANT == "float32" and INFERENCE_BACKEND != "tflite":
+            raise ValueError("WORKER_START_METHOD=fork needs the TFLite backend or a quantized variant")
+        # inference.INFERENCE_THREADS was read at import, before the
+        # environment above was set, so the thread count is passed explicitly
+        preload(threads=intra_op_threads)
+    ctx = mp.get_context(POOL_START_METHOD)
+    # Every child has its own task and result pipes. A child killed while
+    # blocked on a shared multiprocessing.Queue would die holding the queue's
+    # lock and wedge every other child; a pipe only breaks for its own child.
+    children = [None] * processes
+    task_pipes = [None] * processes     # supervisor's sending end per child
+    result_pipes = [None] * processes   # supervisor's receiving end per child
+    # The chunk each child is working on; a child is sent its next chunk only
+    # once it has finished the previous one, so these are exactly the scans to
+    # release if it dies or the pool stops
+    current = [[] for _ in range(processes)]
+    idle = threading.Condition()
+    undispatched = []
+    stats = [{"scans": 0, "chunks": 0, "busy": 0.0, "restarts": 0} for _ in range(processes)]
+    started_at = time.monotonic()
+    stopping = threading.Event()
+
+    def start_child(index):
+        task_reader, task_pipes[index] = ctx.Pipe(duplex=False)
+        result_pipes[index], result_writer_end = ctx.Pipe(duplex=False)
+        children[index] = ctx.Process(
+            target=pool_child, args=(index, task_reader, result_writer_end), name=f"diagnosis-child-{index}"
+        )
+        children[index].start()
+        # The child holds its own copies; closing ours lets EOF / broken pipe report its exit
+        task_reader.close()
+        result_writer_end.close()
+
+    def handle_result(index, message):
+        scans, busy = message
+        with idle:
+            current[index] = []
+            stats[index]["scans"] += scans
+            stats[index]["chunks"] += 1
+            stats[index]["busy"] += busy
+            idle.notify_all()
+
+    def dispatch(chunk):
+        """Send a chunk to an idle child, waiting until one is"""
+        with idle:
+            idle.wait_for(lambda: any(not scans for scans in current))
+            index = next(index for index, scans in enumerate(current) if not scans)
+            current[index] = chunk
+            try:
+                task_pipes[index].send(chunk)
+            except OSError:
+                # The child just died; monitor() restarts it and releases the chunk
+                pass
+
+    def receive_results():
+        for pipe in wait_connections([pipe for pipe in result_pipes if not pipe.closed], timeout=1):
+            index = result_pipes.index(pipe)
+            try:
+                handle_result(index, pipe.recv())
+            except (EOFError, OSError):
+                # The child exited; monitor() notices and restarts it
+                pipe.close()
+
+    def print_stats():
+        uptime = time.monotonic() - started_at
+        for index, child_stats in enumerate(stats):
+            print(
+                f"Child {index} (pid {children[index].pid}): {child_stats['scans']} scans, "
+                f"{child_stats['scans'] / uptime:.2f} scans/s, "
+                f"busy {100 * child_stats['busy'] / uptime:.0f}%, "
+                f"{child_stats['restarts']} restarts"
+            )
+
+    def monitor():
+        next_stats = time.monotonic() + POOL_STATS_INTERVAL
+        while not stopping.is_set():
+            receive_results()
+            for index, child in enumerate(children):
+                if not child.is_alive() and not stopping.is_set():
+                    print(f"Child {index} exited with code {child.exitcode}, restarting")
+                    task_pipes[index].close()
+                    result_pipes[index].close()
+                    with idle:
+                        lost, current[index] = current[index], []
+                        stats[index]["restarts"] += 1
+                        start_child(index)
+                        idle.notify_all()
+                    release_scans([scan["scan_id"] for scan in lost])
+            if time.monotonic() >= next_stats:
+                next_stats = time.monotonic() + POOL_STATS_INTERVAL
+                print_stats()
+
+    def request_shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    def forward_reload(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signum)
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+    if hasattr(signal, "SIGHUP"):
+        # Every child holds its own model, so each one reloads it
+        signal.signal(signal.SIGHUP, forward_reload)
+    print(f"Diagnosis worker pool running with {processes} processes x {intra_op_threads} threads...")
+    for index in range(processes):
+        start_child(index)
+    monitor_thread = threading.Thread(target=monitor, name="pool-monitor", daemon=True)
+    monitor_thread.start()
+
+    scheduler = ScanScheduler()
+    start_intake(scheduler, poll_interval, batch_size, intake_mode)
+    try:
+        for scans in scheduled_scans(scheduler, CLAIM_BATCH_SIZE):
+            try:
+                claimed = claim_scans(scans)
+            except Exception as e:
+                print(f"Worker error: {str(e)}")
+                continue
+            # Chunks of one batch each so every child gets a share; waiting for
+            # an idle child holds back claiming (and keeps the scheduler
+            # deciding what runs next) while children are busy
+            undispatched = [claimed[chunk_start:chunk_start + batch_size]
+                            for chunk_start in range(0, len(claimed), batch_size)]
+            while undispatched:
+                dispatch(undispatched[0])
+                undispatched.pop(0)
+    except KeyboardInterrupt:
+        print("Shutting down worker pool...")
+    finally:
+        stopping.set()
+        monitor_thread.join()
+
+        release_scans([scan["scan_id"] for chunk in undispatched for scan in chunk])
+        for pipe in task_pipes:
+            try:
+                pipe.send(None)
+            except OSError:
+                pass
+
+        deadline = time.monotonic() + CHILD_SHUTDOWN_TIMEOUT
+        for child in children:
+            child.join(max(0.0, deadline - time.monotonic()))
+            if child.is_alive():
+                child.terminate()
+                child.join()
+
+        for index, pipe in enumerate(result_pipes):
+            try:
+                while pipe.poll():
+                    handle_result(index, pipe.recv())
+            except (EOFError, OSError):
+                pass
+        release_scans([scan["scan_id"] for scans in current for scan in scans])
+        print_stats()
 
 if __name__ == "__main__":
-    run_worker()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Diagnose pending scans")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="run N inference child processes under a supervisor")
+    parser.add_argument("--intra-op-threads", type=int, default=None,
+                        help="inference threads per child (default: cores / N)")
+    args = parser.parse_args()
+
+    if args.processes > 0:
+        run_pool(args.processes, args.intra_op_threads)
+    else:
+        run_worker()
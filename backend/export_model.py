@@ -0,0 +1,56 @@
+"""Convert the Keras classifier to the ONNX and TFLite backends.
+
+Usage:
+    python export_model.py [--model model.h5] [--formats onnx tflite]
+
+Writes model.onnx / model.tflite next to the .h5 file, which is where
+inference.load_backend looks for them. The ONNX graph uses the same
+`input` / `output` tensor names as the model served by app/api/predict.
+"""
+import argparse
+
+import tensorflow as tf
+
+from inference import INPUT_SHAPE, backend_model_path
+from model_registry import MODEL_PATH
+
+
+def export_onnx(model, path: str):
+    import tf2onnx
+
+    signature = [tf.TensorSpec((None, *INPUT_SHAPE), tf.float32, name="input")]
+    model_proto, _ = tf2onnx.convert.from_keras(model, input_signature=signature, opset=13)
+    # Keep the output name stable across Keras versions
+    keras_name = model_proto.graph.output[0].name
+    model_proto.graph.output[0].name = "output"
+    for node in model_proto.graph.node:
+        node.output[:] = ["output" if name == keras_name else name for name in node.output]
+        node.input[:] = ["output" if name == keras_name else name for name in node.input]
+    with open(path, "wb") as f:
+        f.write(model_proto.SerializeToString())
+
+
+def export_tflite(model, path: str):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+
+
+EXPORTERS = {"onnx": export_onnx, "tflite": export_tflite}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export model.h5 to other inference backends")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--formats", nargs="+", choices=sorted(EXPORTERS), default=sorted(EXPORTERS))
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    for fmt in args.formats:
+        path = backend_model_path(fmt, args.model)
+        EXPORTERS[fmt](model, path)
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
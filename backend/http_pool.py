@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from collections import deque
+
+import httpx
+import numpy as np
+from postgrest import SyncPostgrestClient
+from storage3 import SyncStorageClient
+from supabase import Client, ClientOptions, SupabaseAuthClient
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# One connection pool per process is shared by every Supabase table, storage
+# and auth call (and by scan downloads). All of them go to the same host, so
+# with HTTP/2 they multiplex over a handful of keep-alive connections instead
+# of each client library opening its own.
+HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", str(HTTP_MAX_CONNECTIONS)))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_HTTP_KEEPALIVE_EXPIRY", "30"))
+# Read / write timeout per request, time allowed to open a connection, and
+# time a request may wait for a free connection before failing with PoolTimeout
+HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_POOL_TIMEOUT = float(os.getenv("SUPABASE_HTTP_POOL_TIMEOUT", "10"))
+
+# Pool wait times kept for the percentiles in stats()
+_WAIT_WINDOW = 1000
+
+
+class PooledClient(httpx.Client):
+    """httpx client on a shared HttpPool transport.
+
+    Closing it leaves the pool open. aclose() is the name the supabase client
+    libraries call on their sessions.
+    """
+
+    def aclose(self):
+        self.close()
+
+
+class _InstrumentedTransport(httpx.BaseTransport):
+    """Wraps the pool's transport to count connection reuse and time pool waits.
+
+    httpcore reports progress through the request's "trace" extension. The
+    first event of a request marks the moment it got a connection: either
+    opening a new one (connect_tcp) or sending on an existing one.
+    """
+
+    def __init__(self, transport: httpx.HTTPTransport):
+        self._transport = transport
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.pool_timeouts = 0
+        self._waits = deque(maxlen=_WAIT_WINDOW)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        state = {"waited": None, "connected": False}
+        upstream = request.extensions.get("trace")
+
+        def trace(event: str, info: dict):
+            if state["waited"] is None:
+                state["waited"] = time.perf_counter() - started
+            if event == "connection.connect_tcp.started":
+                state["connected"] = True
+            if upstream is not None:
+                upstream(event, info)
+
+        request.extensions["trace"] = trace
+        try:
+            return self._transport.handle_request(request)
+        except httpx.PoolTimeout:
+            with self._lock:
+                self.pool_timeouts += 1
+                self._waits.append(time.perf_counter() - started)
+            raise
+        finally:
+            if state["waited"] is not None:
+                with self._lock:
+                    self.requests += 1
+                    self.new_connections += state["connected"]
+                    self._waits.append(state["waited"])
+
+    def close(self):
+        # Clients sharing the pool close their sessions independently; the
+        # connections themselves are closed by HttpPool.close()
+        pass
+
+    def replace(self, transport: httpx.HTTPTransport):
+        """Swap in a fresh transport and reset the counters, e.g. in a forked child"""
+        self._transport = transport
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.pool_timeouts = 0
+        self._waits = deque(maxlen=_WAIT_WINDOW)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = np.array(self._waits) if self._waits else None
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reuse_ratio": (1 - self.new_connections / self.requests) if self.requests else None,
+                "pool_timeouts": self.pool_timeouts,
+                "pool_wait_p50_ms": round(float(np.percentile(waits, 50)) * 1000, 3) if waits is not None else None,
+                "pool_wait_p95_ms": round(float(np.percentile(waits, 95)) * 1000, 3) if waits is not None else None,
+                "pool_wait_max_ms": round(float(waits.max()) * 1000, 3) if waits is not None else None,
+            }
+
+
+class HttpPool:
+    """A keep-alive (HTTP/2 when h2 is installed) connection pool that clients are created on"""
+
+    def __init__(self, max_connections: int = HTTP_MAX_CONNECTIONS, max_keepalive: int = HTTP_MAX_KEEPALIVE,
+                 keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY, timeout: float = HTTP_TIMEOUT,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT, pool_timeout: float = HTTP_POOL_TIMEOUT,
+                 http2: bool = HTTP2_AVAILABLE):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_timeout = pool_timeout
+        self._transport_options = {
+            "http2": http2,
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry),
+        }
+        self.transport = _InstrumentedTransport(httpx.HTTPTransport(**self._transport_options))
+
+    def client(self, base_url: str = "", headers: dict = None, timeout: float = None) -> PooledClient:
+        """A client with its own base URL and headers whose requests go through this pool"""
+        return PooledClient(
+            transport=self.transport,
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(timeout or self.timeout, connect=self.connect_timeout, pool=self.pool_timeout),
+            follow_redirects=True,
+        )
+
+    def stats(self) -> dict:
+        return self.transport.stats()
+
+    def close(self):
+        self.transport._transport.close()
+
+    def after_fork(self):
+        """Give a forked child its own connections.
+
+        The inherited ones are dropped without closing them: they are the
+        parent's TLS / HTTP/2 streams, and httpcore's locks may have been held
+        by another parent thread at the moment of the fork.
+        """
+        self.transport.replace(httpx.HTTPTransport(**self._transport_options))
+
+
+class _PooledPostgrestClient(SyncPostgrestClient):
+    def __init__(self, base_url: str, pool: HttpPool, **kwargs):
+        self._pool = pool
+        super().__init__(base_url, **kwargs)
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return self._pool.client(base_url=base_url, headers=headers)
+
+
+class _PooledStorageClient(SyncStorageClient):
+    def __init__(self, url: str, headers: dict, pool: HttpPool):
+        self._pool = pool
+        super().__init__(url, headers)
+
+    def _create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return self._pool.client(base_url=base_url, headers=headers)
+
+
+class PooledSupabaseClient(Client):
+    """supabase Client whose table, storage and auth calls all go through one HttpPool.
+
+    Timeouts come from the pool (SUPABASE_HTTP_*), not from the per-service
+    timeouts in ClientOptions. Realtime keeps its own websocket.
+    """
+
+    def __init__(self, supabase_url: str, supabase_key: str, options: ClientOptions = None, pool: HttpPool = None):
+        # Set before Client.__init__, which creates the auth client
+        self.pool = pool or http_pool
+        super().__init__(supabase_url, supabase_key, options)
+
+    def _init_supabase_auth_client(self, auth_url, client_options, verify=True, proxy=None):
+        return SupabaseAuthClient(
+            url=auth_url,
+            auto_refresh_token=client_options.auto_refresh_token,
+            persist_session=client_options.persist_session,
+            storage=client_options.storage,
+            headers=client_options.headers,
+            flow_type=client_options.flow_type,
+            http_client=self.pool.client(),
+        )
+
+    def _init_postgrest_client(self, rest_url, headers, schema, timeout=None, verify=True, proxy=None):
+        return _PooledPostgrestClient(rest_url, self.pool, headers=headers, schema=schema)
+
+    def _init_storage_client(self, storage_url, headers, storage_client_timeout=None, verify=True, proxy=None):
+        return _PooledStorageClient(storage_url, headers, self.pool)
+
+
+def create_supabase_client(supabase_url: str, supabase_key: str, options: ClientOptions = None,
+                           pool: HttpPool = None) -> PooledSupabaseClient:
+    """Drop-in for supabase.create_client that shares `pool` (default: http_pool)"""
+    return PooledSupabaseClient(supabase_url, supabase_key, options, pool)
+
+
+# The process-wide pool
+http_pool = HttpPool()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=http_pool.after_fork)
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Model input shape without the batch dimension
+INPUT_SHAPE = (224, 224, 3)
+
+# Which runtime serves the classifier: "tensorflow" (model.h5), "onnx"
+# (model.onnx via ONNX Runtime) or "tflite" (model.tflite). ONNX and TFLite
+# never import TensorFlow, which keeps startup time and RSS down. Use
+# export_model.py to produce the converted files and check_backend_parity.py
+# to compare them against TensorFlow before switching.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "tensorflow")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # 0 = runtime default
+
+BACKEND_SUFFIXES = {"tensorflow": ".h5", "onnx": ".onnx", "tflite": ".tflite"}
+
+# Quantized variants: MODEL_VARIANT=int8 (dynamic-range) or fp16 serves
+# model.<variant>.tflite instead of the float32 model. quantize_model.py only
+# writes those files after the variant passes its accuracy gate, so a variant
+# that was never promoted fails to load instead of silently serving.
+MODEL_VARIANT = os.getenv("MODEL_VARIANT", "float32")
+QUANTIZED_VARIANTS = ("int8", "fp16")
+
+
+def warmup_batch_sizes(max_batch_size: int) -> list:
+    """Powers of two up to (and including) the largest batch we serve"""
+    sizes = [1]
+    while sizes[-1] * 2 < max_batch_size:
+        sizes.append(sizes[-1] * 2)
+    if sizes[-1] != max_batch_size:
+        sizes.append(max_batch_size)
+    return sizes
+
+
+def backend_model_path(backend: str, model_path: str) -> str:
+    """The model file for a backend, derived from the .h5 path by swapping the suffix"""
+    return str(Path(model_path).with_suffix(BACKEND_SUFFIXES[backend]))
+
+
+def variant_model_path(model_path: str, variant: str, candidate: bool = False) -> str:
+    """Path of a quantized TFLite variant (or its not yet promoted candidate) next to the .h5"""
+    path = Path(model_path)
+    suffix = ".candidate.tflite" if candidate else ".tflite"
+    return str(path.with_name(f"{path.stem}.{variant}{suffix}"))
+
+
+class InferenceBackend:
+    """Common warm-up handling; subclasses implement predict()"""
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Run one forward pass over a (n, 224, 224, 3) batch"""
+        raise NotImplementedError
+
+    def warm_up(self, batch_sizes) -> float:
+        """Run a zero batch of every size, returning the seconds spent"""
+        started = time.monotonic()
+        for batch_size in batch_sizes:
+            self.predict(np.zeros((batch_size, *INPUT_SHAPE), dtype=np.float32))
+        return time.monotonic() - started
+
+
+class CompiledModel(InferenceBackend):
+    """A Keras model behind a tf.function traced once for any batch size.
+
+    The fixed (None, 224, 224, 3) float32 input signature means the graph is
+    traced a single time, and `warm_up` pays that cost plus per-shape kernel
+    setup before real traffic arrives. `ready` is set once warm-up finished.
+    """
+
+    def __init__(self, model):
+        import tensorflow as tf
+
+        self.model = model
+        self._tf = tf
+        self._predict = tf.function(
+            lambda batch: model(batch, training=False),
+            input_signature=[tf.TensorSpec((None, *INPUT_SHAPE), tf.float32)],
+        )
+
+    @classmethod
+    def load(cls, model_path: str, threads: int = 0) -> "CompiledModel":
+        import tensorflow as tf
+
+        if threads:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+        return cls(tf.keras.models.load_model(model_path))
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self._predict(self._tf.convert_to_tensor(batch, dtype=self._tf.float32)).numpy()
+
+
+class OnnxModel(InferenceBackend):
+    """The classifier exported to ONNX, served by ONNX Runtime on CPU"""
+
+    def __init__(self, model_path: str, threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class TFLiteModel(InferenceBackend):
+    """The classifier converted to TFLite, using tflite_runtime when it is installed.
+
+    The interpreter is not thread-safe and has a fixed input shape, so calls
+    are serialized and the input tensor is resized when the batch size changes.
+    """
+
+    def __init__(self, model_path: str, threads: int = 0):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=threads or None)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+
+def model_file(model_path: str, backend: str = None, variant: str = None) -> str:
+    """The file a backend/variant combination actually loads for a given .h5 path"""
+    backend = backend or INFERENCE_BACKEND
+    variant = variant or MODEL_VARIANT
+    if variant != "float32":
+        if variant not in QUANTIZED_VARIANTS:
+            raise ValueError(f"Unknown model variant {variant!r}, expected float32 or one of {QUANTIZED_VARIANTS}")
+        return variant_model_path(model_path, variant)
+    if backend not in BACKEND_SUFFIXES:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {sorted(BACKEND_SUFFIXES)}")
+    return backend_model_path(backend, model_path)
+
+
+def load_backend(model_path: str, backend: str = None, threads: int = None, variant: str = None) -> InferenceBackend:
+    """Load the classifier for the configured backend and variant.
+
+    `model_path` is the Keras .h5 path; ONNX and TFLite load the file with the
+    same name and their own suffix next to it. Quantized variants are always
+    served through TFLite.
+    """
+    backend = backend or INFERENCE_BACKEND
+    threads = INFERENCE_THREADS if threads is None else threads
+    variant = variant or MODEL_VARIANT
+    path = model_file(model_path, backend, variant)
+    if variant != "float32" or backend == "tflite":
+        return TFLiteModel(path, threads)
+    if backend == "onnx":
+        return OnnxModel(path, threads)
+    return CompiledModel.load(path, threads)
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+# Jobs (and the uploaded image of every unfinished job) live under JOB_DIR, so
+# queued jobs survive a restart. Finished jobs are kept for JOB_RETENTION_SECONDS.
+# Relative paths are resolved once at import, not against each later working directory.
+_DEFAULT_JOB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs")
+JOB_DIR = os.path.abspath(os.getenv("JOB_DIR", _DEFAULT_JOB_DIR))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+
+# Same vocabulary as scans.diagnosis_status
+PENDING_STATUS = "pending"
+PROCESSING_STATUS = "processing"
+COMPLETED_STATUS = "completed"
+FAILED_STATUS = "failed"
+FINISHED_STATUSES = (COMPLETED_STATUS, FAILED_STATUS)
+
+_COLUMNS = ("job_id", "status", "filename", "digest", "result", "error", "created_at", "started_at", "finished_at")
+
+
+class JobStore:
+    """SQLite-backed job records plus the uploaded image of each unfinished job"""
+
+    def __init__(self, directory: str = JOB_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "jobs.db"), check_same_thread=False, isolation_level=None)
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute(
+            "create table if not exists jobs ("
+            " job_id text primary key, status text not null, filename text, digest text not null,"
+            " result text, error text, created_at real not null, started_at real, finished_at real)"
+        )
+        self._db.execute("create index if not exists jobs_status_created on jobs (status, created_at)")
+
+    def payload_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.upload")
+
+    def create(self, filename: str, digest: str, source) -> dict:
+        """Persist a new pending job, copying the upload out of its spool first"""
+        job_id = uuid.uuid4().hex
+        with open(self.payload_path(job_id), "wb") as f:
+            source.seek(0)
+            shutil.copyfileobj(source, f)
+        with self._lock:
+            self._db.execute(
+                "insert into jobs (job_id, status, filename, digest, created_at) values (?, ?, ?, ?, ?)",
+                (job_id, PENDING_STATUS, filename, digest, time.time()),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._db.execute(f"select {', '.join(_COLUMNS)} from jobs where job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def mark_processing(self, job_id: str):
+        with self._lock:
+            self._db.execute(
+                "update jobs set status = ?, started_at = ? where job_id = ?",
+                (PROCESSING_STATUS, time.time(), job_id),
+            )
+
+    def finish(self, job_id: str, result: dict = None, error: str = None):
+        with self._lock:
+            self._db.execute(
+                "update jobs set status = ?, result = ?, error = ?, finished_at = ? where job_id = ?",
+                (FAILED_STATUS if error else COMPLETED_STATUS,
+                 json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+        try:
+            os.remove(self.payload_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def unfinished(self) -> list:
+        """Ids of jobs a previous run accepted but never finished, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "select job_id from jobs where status in (?, ?) order by created_at",
+                (PENDING_STATUS, PROCESSING_STATUS),
+            ).fetchall()
+        return [job_id for job_id, in rows]
+
+    def purge(self, older_than: float):
+        """Drop finished jobs that finished before `older_than`"""
+        with self._lock:
+            self._db.execute(
+                "delete from jobs where status in (?, ?) and finished_at < ?",
+                (*FINISHED_STATUSES, older_than),
+            )
+
+
+class JobRunner:
+    """Runs persisted jobs on the event loop with a fixed number of worker tasks.
+
+    `run_job(job, payload_path)` is a coroutine returning the job's result
+    dict; exceptions mark the job failed. Status changes wake the long-poll
+    and SSE waiters of that job only, through a per-job event.
+    """
+
+    def __init__(self, run_job, workers: int, max_pending: int, directory: str = JOB_DIR):
+        self.directory = directory
+        self.store = None
+        self.run_job = run_job
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue = None
+        self._waiters = {}  # job_id -> asyncio.Event set on that job's next status change
+        self._tasks = []
+
+    async def start(self, ready=None):
+        """Open the store, re-queue unfinished jobs and start the workers once `ready` (a threading.Event) is set"""
+        self.store = await asyncio.to_thread(JobStore, self.directory)
+        self._queue = asyncio.Queue()
+        recovered = await asyncio.to_thread(self.store.unfinished)
+        for job_id in recovered:
+            self._queue.put_nowait(job_id)
+        if recovered:
+            print(f"Re-queued {len(recovered)} unfinished jobs")
+        self._tasks = [asyncio.create_task(self._work(ready)) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge()))
+
+    async def stop(self):
+        # Jobs still processing stay so in the store and are re-queued on the next start
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def full(self) -> bool:
+        return self._queue.qsize() >= self.max_pending
+
+    async def submit(self, filename: str, digest: str, source) -> dict:
+        job = await asyncio.to_thread(self.store.create, filename, digest, source)
+        self._queue.put_nowait(job["job_id"])
+        return job
+
+    async def get(self, job_id: str):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def wait(self, job_id: str, timeout: float, seen_status: str = None):
+        """Return the job once its status differs from `seen_status` (or it finishes), or after `timeout`"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            # Registered before reading, so a change landing during the read still wakes us
+            changed = self._waiters.setdefault(job_id, asyncio.Event())
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED_STATUSES:
+                # Nothing will notify this job again
+                if self._waiters.get(job_id) is changed and not changed.is_set():
+                    del self._waiters[job_id]
+                return job
+            if seen_status and job["status"] != seen_status:
+                return job
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return job
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return job
+
+    def _notify(self, job_id: str):
+        changed = self._waiters.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+    async def _work(self, ready):
+        # Polled rather than waited on in a thread, so stop() can always cancel
+        while ready is not None and not ready.is_set():
+            await asyncio.sleep(0.5)
+        while True:
+            job_id = await self._queue.get()
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED_STATUSES:
+                continue
+            await asyncio.to_thread(self.store.mark_processing, job_id)
+            self._notify(job_id)
+            try:
+                result = await self.run_job(job, self.store.payload_path(job_id))
+                await asyncio.to_thread(self.store.finish, job_id, result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await asyncio.to_thread(self.store.finish, job_id, None, str(e) or type(e).__name__)
+            self._notify(job_id)
+
+    async def _purge(self):
+        while True:
+            await asyncio.to_thread(self.store.purge, time.time() - JOB_RETENTION_SECONDS)
+            await asyncio.sleep(min(JOB_RETENTION_SECONDS, 3600))
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize() if self._queue else 0, "max_pending": self.max_pending}
@@ -0,0 +1,74 @@
+"""Load-test the /predict service at increasing concurrency.
+
+Usage:
+    python load_test.py path/to/scan.png [--url http://localhost:5000/predict]
+        [--concurrency 1 4 16 64] [--requests 200]
+
+For each concurrency level, that many clients post the image back to back
+until --requests responses have arrived. Reports throughput, p50/p99
+latency of successful responses and how many were shed with 429/503.
+Pass several images to exercise decoding and inference rather than the
+prediction cache (identical uploads are answered from it after the first).
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+
+async def run_level(url: str, images: list, concurrency: int, total: int) -> dict:
+    latencies = []
+    statuses = Counter()
+    sent = 0
+
+    async def client(http: httpx.AsyncClient):
+        nonlocal sent
+        while sent < total:
+            image = images[sent % len(images)]
+            sent += 1
+            started = time.perf_counter()
+            try:
+                response = await http.post(url, files={"file": (image.name, image.read_bytes())})
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else float("nan"),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000) if latencies else float("nan"),
+        "statuses": dict(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /predict throughput and latency under load")
+    parser.add_argument("images", nargs="+", help="image files to upload (used round-robin)")
+    parser.add_argument("--url", default="http://localhost:5000/predict")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    args = parser.parse_args()
+
+    images = [Path(image) for image in args.images]
+    print(f"{'clients':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}  statuses")
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_level(args.url, images, concurrency, args.requests))
+        print(f"{result['concurrency']:>8} {result['throughput']:>8.1f} {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f}  {result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from inference import INFERENCE_BACKEND, MODEL_VARIANT, InferenceBackend, load_backend, model_file
+
+# Path of the Keras model; ONNX / TFLite / quantized files are looked up next to it
+MODEL_PATH = os.getenv("MODEL_PATH", r"C:\Users\Informatics\Desktop\model.h5")
+
+# Version reported for the model loaded from MODEL_PATH; defaults to the first
+# 12 hex digits of the model file's SHA-256.
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+
+# Seconds between checks of the active model file; when it changes on disk the
+# new file is loaded, warmed up and swapped in. 0 disables the watcher.
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+
+_active = None      # ModelVersion currently serving new requests
+_metrics = []       # load metrics of every version loaded in this process
+_load_lock = threading.Lock()
+_reload_lock = threading.Lock()
+
+
+class ModelVersion:
+    """A loaded model together with the version it is served as.
+
+    Callers should take one ModelVersion per batch (`get_model()`) and use it
+    for the whole batch: a reload swaps in a new version for later batches
+    while batches already holding the old one finish on it.
+    """
+
+    def __init__(self, version: str, model: InferenceBackend, source_path: str, path: str, backend: str, variant: str,
+                 threads: int = None):
+        self.version = version
+        self.model = model
+        self.source_path = source_path  # the .h5 path the model was resolved from
+        self.path = path                # the file actually loaded
+        self.backend = backend
+        self.variant = variant
+        self.threads = threads          # inference threads it was loaded with (None = INFERENCE_THREADS)
+        self.fingerprint = _fingerprint(path)
+
+    def predict(self, batch):
+        return self.model.predict(batch)
+
+    def warm_up(self, batch_sizes) -> float:
+        return self.model.warm_up(batch_sizes)
+
+
+def _fingerprint(path: str) -> tuple:
+    """Cheap identity of a model file (or SavedModel directory) on disk"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    paths = [path] if os.path.isfile(path) else sorted(
+        os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+    )
+    for file_path in paths:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None where it cannot be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def load_version(model_path: str = None, backend: str = None, variant: str = None, version: str = None,
+                 threads: int = None) -> ModelVersion:
+    """Load a model without making it active, recording load time and memory.
+
+    `threads` pins the runtime's intra-op threads; None uses INFERENCE_THREADS
+    as read at import time.
+    """
+    model_path = model_path or MODEL_PATH
+    backend = backend or INFERENCE_BACKEND
+    variant = variant or MODEL_VARIANT
+    path = model_file(model_path, backend, variant)
+
+    rss_before = _rss_bytes()
+    started = time.monotonic()
+    model = load_backend(model_path, backend, threads=threads, variant=variant)
+    load_seconds = time.monotonic() - started
+    rss_after = _rss_bytes()
+
+    sha256 = _sha256(path)
+    version = version or sha256[:12]
+    rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    _metrics.append({
+        "version": version,
+        "path": path,
+        "backend": backend,
+        "variant": variant,
+        "sha256": sha256,
+        "load_seconds": round(load_seconds, 3),
+        "rss_delta_bytes": rss_delta,
+        "loaded_at": datetime.now(timezone.utc).isoformat(),
+    })
+    print(f"Model {version} loaded from {path} ({backend}/{variant}) in {load_seconds:.2f}s"
+          + (f", +{rss_delta / 2**20:.0f} MB RSS" if rss_delta is not None else ""))
+    return ModelVersion(version, model, model_path, path, backend, variant, threads)
+
+
+def get_model() -> ModelVersion:
+    """Return the active model version, loading MODEL_PATH on first use.
+
+    Nothing is loaded at import time, so importing app.py or the worker (tests,
+    tooling, the pool supervisor) stays cheap. Concurrent first calls load once.
+    """
+    global _active
+    if _active is None:
+        with _load_lock:
+            if _active is None:
+                _active = load_version(version=MODEL_VERSION)
+    return _active
+
+
+def preload(threads: int = None) -> ModelVersion:
+    """Load the model now, e.g. in a parent process before forking workers.
+
+    Children forked afterwards reuse the already loaded weights through
+    copy-on-write instead of each loading their own copy. Only do this with
+    fork-safe runtimes (TFLite); TensorFlow and ONNX Runtime start thread
+    pools that do not survive a fork. Pass `threads` explicitly: the forked
+    children never re-read INFERENCE_THREADS from the environment.
+    """
+    global _active
+    with _load_lock:
+        if _active is None:
+            _active = load_version(version=MODEL_VERSION, threads=threads)
+    return _active
+
+
+def reload_model(model_path: str = None, backend: str = None, variant: str = None,
+                 version: str = None, warm_up_sizes=(1,), threads: int = None) -> ModelVersion:
+    """Load and warm up a new model version, then atomically make it the active one.
+
+    Defaults to reloading the active model's path, backend, variant and threads.
+    Requests keep being served by the current version until the swap.
+    """
+    global _active
+    with _reload_lock:
+        current = _active
+        new = load_version(
+            model_path or (current and current.source_path),
+            backend or (current and current.backend),
+            variant or (current and current.variant),
+            version,
+            threads if threads is not None else (current and current.threads),
+        )
+        elapsed = new.warm_up(warm_up_sizes)
+        _active = new
+    print(f"Model {new.version} active after {elapsed:.2f}s warm-up"
+          + (f", replacing {current.version}" if current else ""))
+    return new
+
+
+def reload_in_background(warm_up_sizes=(1,), **kwargs) -> threading.Thread:
+    """Run reload_model in a thread, logging instead of raising on failure"""
+    def run():
+        try:
+            reload_model(warm_up_sizes=warm_up_sizes, **kwargs)
+        except Exception as e:
+            print(f"Model reload failed, keeping the current version: {str(e)}")
+
+    thread = threading.Thread(target=run, name="model-reload", daemon=True)
+    thread.start()
+    return thread
+
+
+def watch_model_file(interval: float = MODEL_WATCH_INTERVAL, warm_up_sizes=(1,)):
+    """Reload the active model whenever its file changes on disk; no-op when interval is 0"""
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            current = _active
+            if current is None:
+                continue
+            try:
+                changed = _fingerprint(current.path) != current.fingerprint
+            except OSError:
+                # Mid-copy or temporarily missing; look again next time
+                continue
+            if changed:
+                print(f"Model file {current.path} changed, reloading")
+                try:
+                    reload_model(warm_up_sizes=warm_up_sizes)
+                except Exception as e:
+                    print(f"Model reload failed, keeping the current version: {str(e)}")
+
+    thread = threading.Thread(target=run, name="model-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+def active_version():
+    """Version string of the active model, or None before the first load"""
+    return _active.version if _active is not None else None
+
+
+def model_metrics() -> list:
+    """Load time, memory and identity of every model version loaded in this process"""
+    return [dict(metrics, active=metrics["version"] == active_version()) for metrics in _metrics]
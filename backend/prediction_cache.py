@@ -0,0 +1,156 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+# Predictions are cached per (SHA-256 of the image bytes, model version), so a
+# re-uploaded scan skips decoding and inference, and a model reload never
+# serves results from the previous version. PREDICTION_CACHE_SIZE entries are
+# kept in memory (LRU); PREDICTION_CACHE_DB adds an SQLite tier on disk that
+# every worker process and app instance on the machine shares.
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_DB = os.getenv("PREDICTION_CACHE_DB")
+PREDICTION_CACHE_DB_MAX_ROWS = int(os.getenv("PREDICTION_CACHE_DB_MAX_ROWS", "1000000"))
+
+_PRUNE_EVERY = 1000
+
+# Caches in this process, reset in the child after a fork
+_caches = weakref.WeakSet()
+# SQLite connections inherited over a fork: never used, and never closed
+# either, since closing one in the child can disturb the parent's WAL
+_inherited_connections = []
+
+
+def image_digest(data: bytes) -> str:
+    """SHA-256 of the raw image bytes, the content part of the cache key"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class PredictionCache:
+    """Two-tier (memory LRU + optional SQLite) cache of model output rows"""
+
+    def __init__(self, max_entries: int = PREDICTION_CACHE_SIZE, db_path: str = PREDICTION_CACHE_DB,
+                 db_max_rows: int = PREDICTION_CACHE_DB_MAX_ROWS):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.db_max_rows = db_max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        _caches.add(self)
+        if db_path:
+            self._db().execute(
+                "create table if not exists predictions ("
+                " digest text not null, model_version text not null, pred blob not null,"
+                " created_at real not null, primary key (digest, model_version))"
+            )
+
+    def _db(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; WAL lets processes read while one writes
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            connection.execute("pragma journal_mode=wal")
+            self._local.connection = connection
+        return connection
+
+    def _after_fork(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            _inherited_connections.append(connection)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: tuple, pred: np.ndarray):
+        with self._lock:
+            self._entries[key] = pred
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, digest: str, model_version: str):
+        """Cached prediction row for an image under a model version, or None"""
+        key = (digest, model_version)
+        with self._lock:
+            pred = self._entries.get(key)
+            if pred is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pred
+
+        if self.db_path:
+            try:
+                row = self._db().execute(
+                    "select pred from predictions where digest = ? and model_version = ?", key
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Prediction cache read failed: {str(e)}")
+                row = None
+            if row is not None:
+                pred = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, pred)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return pred
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, digest: str, model_version: str, pred: np.ndarray):
+        """Store a prediction row; disk failures are logged, never raised"""
+        key = (digest, model_version)
+        pred = np.asarray(pred, dtype=np.float32)
+        self._remember(key, pred)
+        if not self.db_path:
+            return
+
+        try:
+            db = self._db()
+            db.execute(
+                "insert or replace into predictions values (?, ?, ?, ?)",
+                (digest, model_version, pred.tobytes(), time.time()),
+            )
+            with self._lock:
+                self._puts += 1
+                prune = self._puts % _PRUNE_EVERY == 0
+            if prune:
+                db.execute(
+                    "delete from predictions where rowid in (select rowid from predictions"
+                    " order by created_at desc limit -1 offset ?)",
+                    (self.db_max_rows,),
+                )
+        except sqlite3.Error as e:
+            print(f"Prediction cache write failed: {str(e)}")
+
+    def stats(self) -> dict:
+        """Hit/miss counters and hit rate since this process started"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._entries),
+                "disk_enabled": bool(self.db_path),
+            }
+
+
+def _after_fork_in_child():
+    for cache in list(_caches):
+        cache._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
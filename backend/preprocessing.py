@@ -0,0 +1,146 @@
+import io
+import os
+import queue
+
+import numpy as np
+from PIL import Image
+
+# Model input size (width, height)
+IMAGE_SIZE = (224, 224)
+
+# Fast decode: JPEGs are decoded at a reduced DCT scale (Image.draft) and other
+# formats are box-reduced by an integer factor before the final resize, so a
+# multi-megapixel X-ray is never fully materialized at 224x224's expense.
+# Set PREPROCESS_FAST_DECODE=0 to fall back to the full-decode path, and see
+# check_decode_parity.py to compare predictions between the two.
+FAST_DECODE = os.getenv("PREPROCESS_FAST_DECODE", "1") == "1"
+REDUCING_GAP = 2.0
+
+# 16/32-bit grayscale scans normally go through convert("RGB") like every other
+# image, which clips values above 255. PREPROCESS_WINDOW_HIGH_BIT_DEPTH=1
+# instead windows each scan to its own min/max. This changes model inputs, so
+# check it with check_decode_parity.py --window before turning it on.
+WINDOW_HIGH_BIT_DEPTH = os.getenv("PREPROCESS_WINDOW_HIGH_BIT_DEPTH", "0") == "1"
+
+# Modes the resize + normalize path handles without converting to RGB first.
+# Single-channel images are broadcast across the three RGB channels.
+_DIRECT_MODES = ("RGB", "L")
+
+# Modes whose RGB conversion only drops the alpha band, so they can be reduced first
+_ALPHA_MODES = ("RGBA", "LA")
+
+# 16-bit and 32-bit single-channel modes (16-bit PNG, 12-bit scanners, TIFF)
+_HIGH_BIT_DEPTH_MODES = ("I;16", "I;16B", "I;16L", "I;16N", "I", "F")
+
+_SCALE = np.float32(255)
+
+
+def decode_image(data, size=IMAGE_SIZE, fast: bool = None) -> Image.Image:
+    """Open image bytes or a binary file object, letting the JPEG decoder scale down towards `size` while decoding"""
+    fast = FAST_DECODE if fast is None else fast
+    # File objects (spooled uploads) are read in place instead of copied into a BytesIO
+    img = Image.open(data if hasattr(data, "read") else io.BytesIO(data))
+    if fast:
+        # Only JPEG honours draft(); it picks the smallest DCT scale that still
+        # covers `size`, so the resize below works on far fewer pixels.
+        img.draft("RGB", size)
+    return img
+
+
+def _preprocess_high_bit_depth(image: Image.Image, out: np.ndarray, size, reducing_gap) -> np.ndarray:
+    """Resize a 16/32-bit grayscale image in float and window its own value range to [0, 1]"""
+    # Converting straight to RGB would clip everything above 255 to white;
+    # medical images rarely use the full 16 bits, so stretch [min, max] instead.
+    pixels = np.asarray(image.convert("F").resize(size, reducing_gap=reducing_gap))
+    low, high = pixels.min(), pixels.max()
+    np.subtract(pixels[..., np.newaxis], low, out=out)
+    out /= (high - low) or 1
+    return out
+
+
+def _reduce_raw_bands(image: Image.Image, size, reducing_gap) -> Image.Image:
+    """Box-reduce an RGBA/LA image by an integer factor on its raw bands.
+
+    convert("RGB") ignores alpha, so reducing first and converting the small
+    image gives the same pixels as converting at full resolution. Image.reduce()
+    would premultiply alpha first, itself a full-resolution conversion.
+    """
+    factor_x = int(image.width / size[0] / reducing_gap) or 1
+    factor_y = int(image.height / size[1] / reducing_gap) or 1
+    if factor_x == 1 and factor_y == 1:
+        return image
+    return image._new(image.im.reduce((factor_x, factor_y), (0, 0) + image.size))
+
+
+def preprocess_image(image: Image.Image, out: np.ndarray = None, size=IMAGE_SIZE, fast: bool = None,
+                     window: bool = None) -> np.ndarray:
+    """Resize an image and write it as float32 in [0, 1] into `out` (height, width, 3).
+
+    A new array is allocated when `out` is not given. Grayscale images are
+    broadcast across the RGB channels and RGBA/palette images drop to RGB,
+    so no intermediate float copies are made.
+    """
+    fast = FAST_DECODE if fast is None else fast
+    window = WINDOW_HIGH_BIT_DEPTH if window is None else window
+    reducing_gap = REDUCING_GAP if fast else None
+    if out is None:
+        out = np.empty((size[1], size[0], 3), dtype=np.float32)
+
+    if window and image.mode in _HIGH_BIT_DEPTH_MODES:
+        return _preprocess_high_bit_depth(image, out, size, reducing_gap)
+
+    if image.mode in _ALPHA_MODES and reducing_gap:
+        image = _reduce_raw_bands(image, size, reducing_gap)
+    if image.mode not in _DIRECT_MODES:
+        # Palette indices cannot be averaged, so "P" images are expanded first
+        image = image.convert("RGB")
+    pixels = np.asarray(image.resize(size, reducing_gap=reducing_gap))
+    if pixels.ndim == 2:
+        pixels = pixels[..., np.newaxis]
+
+    np.divide(pixels, _SCALE, out=out)
+    return out
+
+
+def preprocess_batch(images: list, out: np.ndarray = None, size=IMAGE_SIZE, fast: bool = None,
+                     window: bool = None) -> np.ndarray:
+    """Preprocess several images straight into one (n, height, width, 3) float32 batch"""
+    if out is None:
+        out = np.empty((len(images), size[1], size[0], 3), dtype=np.float32)
+    for index, image in enumerate(images):
+        preprocess_image(image, out[index], size, fast, window)
+    return out[:len(images)]
+
+
+def load_input(data, out: np.ndarray = None, size=IMAGE_SIZE, fast: bool = None, window: bool = None) -> np.ndarray:
+    """Decode image bytes (or a binary file object) and return the model input for a single image"""
+    return preprocess_image(decode_image(data, size, fast), out, size, fast, window)
+
+
+class InputPool:
+    """Preallocated float32 model inputs, reused instead of allocating an array per image.
+
+    acquire() hands out a (height, width, 3) slot to preprocess into, waiting
+    while every slot is in use; release() returns it once the image is in a
+    batch. stack() copies slots into a preallocated batch buffer that stays
+    valid until the next stack() call, so only the inference thread calls it.
+    """
+
+    def __init__(self, slots: int, max_batch: int, size=IMAGE_SIZE):
+        self.slots = slots
+        self._free = queue.LifoQueue()
+        for slot in np.empty((slots, size[1], size[0], 3), dtype=np.float32):
+            self._free.put(slot)
+        self._batch = np.empty((max_batch, size[1], size[0], 3), dtype=np.float32)
+
+    def acquire(self, timeout: float = None) -> np.ndarray:
+        return self._free.get(timeout=timeout)
+
+    def release(self, slot: np.ndarray):
+        self._free.put(slot)
+
+    def stack(self, inputs: list) -> np.ndarray:
+        """Copy inputs into the batch buffer and return the filled part of it"""
+        if len(inputs) > len(self._batch):
+            return np.stack(inputs)
+        return np.stack(inputs, out=self._batch[:len(inputs)])
@@ -0,0 +1,105 @@
+"""Build INT8 / float16 variants of the classifier and promote the ones that stay accurate.
+
+Usage:
+    python quantize_model.py path/to/heldout/scans [--model model.h5]
+        [--variants int8 fp16] [--min-agreement 0.99]
+
+For each variant this converts model.h5 to TFLite (dynamic-range INT8
+weights, or float16 weights), runs the held-out folder through both the
+variant and the float32 model, and compares top-1 classes. A variant is
+promoted to model.<variant>.tflite, which is what MODEL_VARIANT=<variant>
+serves, only if agreement reaches --min-agreement. Otherwise it is left at
+model.<variant>.candidate.tflite for inspection and the script exits 1.
+A JSON report with the evaluation results is written next to the model
+either way.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+from inference import CompiledModel, TFLiteModel, variant_model_path
+from model_registry import MODEL_PATH
+from preprocessing import load_input
+
+EVAL_BATCH_SIZE = 32
+
+
+def convert(model, variant: str) -> bytes:
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+
+def predict_in_batches(backend, inputs: np.ndarray) -> np.ndarray:
+    return np.concatenate([
+        backend.predict(inputs[start:start + EVAL_BATCH_SIZE])
+        for start in range(0, len(inputs), EVAL_BATCH_SIZE)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the classifier behind an accuracy gate")
+    parser.add_argument("folder", help="held-out folder of scans")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--variants", nargs="+", choices=["int8", "fp16"], default=["int8", "fp16"])
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="minimum top-1 agreement with the float32 model required to promote")
+    args = parser.parse_args()
+
+    paths = [path for path in sorted(Path(args.folder).iterdir()) if path.is_file()]
+    if not paths:
+        sys.exit(f"No images found in {args.folder}")
+    inputs = np.stack([load_input(path.read_bytes()) for path in paths])
+
+    model = tf.keras.models.load_model(args.model)
+    reference = predict_in_batches(CompiledModel(model), inputs)
+
+    all_promoted = True
+    for variant in args.variants:
+        candidate_path = variant_model_path(args.model, variant, candidate=True)
+        with open(candidate_path, "wb") as f:
+            f.write(convert(model, variant))
+
+        preds = predict_in_batches(TFLiteModel(candidate_path), inputs)
+        agreement = float((preds.argmax(axis=1) == reference.argmax(axis=1)).mean())
+        deltas = np.abs(preds - reference).max(axis=1) * 100
+        promoted = agreement >= args.min_agreement
+
+        report = {
+            "variant": variant,
+            "source_model": str(args.model),
+            "heldout_images": len(paths),
+            "top1_agreement": agreement,
+            "min_agreement": args.min_agreement,
+            "confidence_delta_mean": float(deltas.mean()),
+            "confidence_delta_max": float(deltas.max()),
+            "size_bytes": os.path.getsize(candidate_path),
+            "promoted": promoted,
+            "evaluated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        report_path = Path(variant_model_path(args.model, variant)).with_suffix(".json")
+        report_path.write_text(json.dumps(report, indent=2))
+
+        if promoted:
+            os.replace(candidate_path, variant_model_path(args.model, variant))
+            print(f"[{variant}] PROMOTED: top-1 agreement {agreement:.2%} >= {args.min_agreement:.2%}, "
+                  f"{report['size_bytes'] / 2**20:.1f} MB")
+        else:
+            all_promoted = False
+            print(f"[{variant}] REJECTED: top-1 agreement {agreement:.2%} < {args.min_agreement:.2%}, "
+                  f"candidate left at {candidate_path}")
+
+    if not all_promoted:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
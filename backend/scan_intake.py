@@ -0,0 +1,85 @@
+import asyncio
+import queue
+import threading
+
+from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+
+
+class RealtimeScanIntake:
+    """Push pending scans onto a queue as soon as Supabase Realtime reports them.
+
+    Listens for INSERT and UPDATE events on `scans` rows whose diagnosis_status
+    is pending and puts {"scan_id", "file_path", "user_id", "scan_type",
+    "priority"} dicts on `intake` (the fields the worker schedules by). The `scans`
+    table must be part of the `supabase_realtime` publication for events to be
+    delivered. The client runs its own asyncio loop in a daemon thread and
+    reconnects on its own; anything missed while disconnected is picked up by
+    the worker's reconcile poll.
+    """
+
+    def __init__(self, supabase_url: str, supabase_key: str, intake: queue.Queue,
+                 pending_status: str = "pending", retry_interval: float = 10):
+        self.realtime_url = f"{supabase_url}/realtime/v1"
+        self.supabase_key = supabase_key
+        self.intake = intake
+        self.pending_status = pending_status
+        self.retry_interval = retry_interval
+        self.subscribed = threading.Event()
+        self._thread = None
+
+    def start(self) -> "RealtimeScanIntake":
+        """Start listening in a background thread"""
+        self._thread = threading.Thread(
+            target=lambda: asyncio.run(self._run()), name="scan-intake", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def _on_change(self, payload: dict):
+        record = payload.get("data", {}).get("record") or {}
+        if record.get("diagnosis_status", self.pending_status) != self.pending_status:
+            return
+        if record.get("scan_id") is None or not record.get("file_path"):
+            return
+        self.intake.put({
+            "scan_id": record["scan_id"],
+            "file_path": record["file_path"],
+            "user_id": record.get("user_id"),
+            "scan_type": record.get("scan_type"),
+            "priority": record.get("priority"),
+        })
+
+    def _on_subscribe(self, state: RealtimeSubscribeStates, error=None):
+        if state == RealtimeSubscribeStates.SUBSCRIBED:
+            self.subscribed.set()
+            print("Realtime intake subscribed to scans")
+        else:
+            self.subscribed.clear()
+            print(f"Realtime intake state {state.value}: {error}")
+
+    async def _subscribe(self) -> AsyncRealtimeClient:
+        client = AsyncRealtimeClient(self.realtime_url, self.supabase_key)
+        channel = client.channel("diagnosis-worker-scans")
+        for event in ("INSERT", "UPDATE"):
+            channel.on_postgres_changes(
+                event,
+                self._on_change,
+                table="scans",
+                filter=f"diagnosis_status=eq.{self.pending_status}",
+            )
+        await channel.subscribe(self._on_subscribe)
+        return client
+
+    async def _run(self):
+        while True:
+            try:
+                client = await self._subscribe()
+                # The client reconnects and rejoins by itself; only start over
+                # when it has given up on the connection.
+                while client.is_connected:
+                    await asyncio.sleep(self.retry_interval)
+                await client.close()
+            except Exception as e:
+                print(f"Realtime intake error: {str(e)}")
+            self.subscribed.clear()
+            await asyncio.sleep(self.retry_interval)
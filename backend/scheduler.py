@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+# Priority levels, most urgent first
+PRIORITIES = ("urgent", "normal", "bulk")
+DEFAULT_PRIORITY = "normal"
+
+# A scan that has waited this many seconds is treated as one level more urgent
+# (two levels after twice as long), so bulk work is delayed, never starved.
+# Aging stops at the urgent level: an aged level takes turns with urgent
+# scans rather than pre-empting them. 0 means strict priority.
+PRIORITY_AGING = float(os.getenv("WORKER_PRIORITY_AGING", "600"))
+
+# Wait times kept per priority for the percentiles in stats()
+_WAIT_WINDOW = 1000
+
+
+class ScanScheduler:
+    """Thread-safe queue of candidate scans ordered by priority and per-tenant fair share.
+
+    Scans are dicts with at least "scan_id"; "priority" (one of PRIORITIES)
+    and "tenant" (e.g. the uploading user) default to normal / no tenant.
+    Within a priority, take() serves tenants round-robin, one scan each, so a
+    tenant with a backlog of thousands does not delay a tenant with three.
+    """
+
+    def __init__(self, aging_seconds: float = PRIORITY_AGING):
+        self.aging_seconds = aging_seconds
+        # one OrderedDict per priority: tenant -> deque of (enqueued_at, scan), in round-robin order
+        self._levels = [OrderedDict() for _ in PRIORITIES]
+        self._queued = set()
+        self._last_level = None  # level served last, for turns between levels of equal rank
+        self._changed = threading.Condition()
+        self._taken = [0] * len(PRIORITIES)
+        self._waits = [deque(maxlen=_WAIT_WINDOW) for _ in PRIORITIES]
+
+    def __len__(self):
+        with self._changed:
+            return len(self._queued)
+
+    def add(self, scans: list) -> int:
+        """Queue scans not already waiting; returns how many were new"""
+        now = time.monotonic()
+        added = 0
+        with self._changed:
+            for scan in scans:
+                if scan["scan_id"] in self._queued:
+                    continue
+                priority = scan.get("priority")
+                level = PRIORITIES.index(priority) if priority in PRIORITIES else PRIORITIES.index(DEFAULT_PRIORITY)
+                self._levels[level].setdefault(scan.get("tenant"), deque()).append((now, scan))
+                self._queued.add(scan["scan_id"])
+                added += 1
+            if added:
+                self._changed.notify_all()
+        return added
+
+    def take(self, max_count: int, timeout: float = None) -> list:
+        """Remove and return up to max_count scans in scheduling order.
+
+        Blocks until at least one scan is queued, or returns [] after timeout.
+        """
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._queued, timeout):
+                return []
+            now = time.monotonic()
+            scans = []
+            while self._queued and len(scans) < max_count:
+                level = self._pick_level(now)
+                tenants = self._levels[level]
+                tenant, entries = next(iter(tenants.items()))
+                enqueued_at, scan = entries.popleft()
+                if entries:
+                    tenants.move_to_end(tenant)
+                else:
+                    del tenants[tenant]
+                self._queued.discard(scan["scan_id"])
+                self._taken[level] += 1
+                self._waits[level].append(now - enqueued_at)
+                scans.append(scan)
+            return scans
+
+    def _pick_level(self, now: float) -> int:
+        ranks = {}
+        for level, tenants in enumerate(self._levels):
+            if not tenants:
+                continue
+            rank = level
+            if self.aging_seconds > 0:
+                oldest = min(entries[0][0] for entries in tenants.values())
+                rank = max(0, rank - int((now - oldest) // self.aging_seconds))
+            ranks[level] = rank
+        best_rank = min(ranks.values())
+        tied = [level for level, rank in ranks.items() if rank == best_rank]
+        # Levels aged up to the same rank take turns, one scan each, so a
+        # drained-down backlog never holds fresh urgent scans back for long
+        level = next((level for level in tied if self._last_level is not None and level > self._last_level), tied[0])
+        self._last_level = level
+        return level
+
+    def stats(self) -> dict:
+        """Queue depth, tenants waiting and wait times (seconds) per priority"""
+        with self._changed:
+            stats = {}
+            for level, priority in enumerate(PRIORITIES):
+                waits = np.array(self._waits[level]) if self._waits[level] else None
+                stats[priority] = {
+                    "depth": sum(len(entries) for entries in self._levels[level].values()),
+                    "tenants": len(self._levels[level]),
+                    "taken": self._taken[level],
+                    "wait_p50": round(float(np.percentile(waits, 50)), 3) if waits is not None else None,
+                    "wait_p95": round(float(np.percentile(waits, 95)), 3) if waits is not None else None,
+                    "wait_max": round(float(waits.max()), 3) if waits is not None else None,
+                }
+            return stats
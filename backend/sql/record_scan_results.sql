@@ -0,0 +1,25 @@
+-- Bulk result write-back used by diagnosis_worker.py: one call records the
+-- outcome of many scans. `results` is a JSON array of objects with scan_id,
+-- diagnosis_status and, for completed scans, diagnosis_type,
+-- confidence_score and model_version. Fields a row leaves out keep their
+-- current value; every listed scan's lease is cleared. Returns the number of
+-- scans updated. Without this function the worker falls back to one update
+-- per completed scan.
+create or replace function record_scan_results(results jsonb)
+returns integer
+language sql
+as $$
+    with updated as (
+        update scans s set
+            diagnosis_status = r.diagnosis_status,
+            diagnosis_type = coalesce(r.diagnosis_type, s.diagnosis_type),
+            confidence_score = coalesce(r.confidence_score, s.confidence_score),
+            model_version = coalesce(r.model_version, s.model_version),
+            lease_expires_at = null
+        -- Populating the scans row type casts scan_id etc. to the real column types
+        from jsonb_populate_recordset(null::scans, results) r
+        where s.scan_id = r.scan_id
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;
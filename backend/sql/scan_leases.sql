@@ -0,0 +1,8 @@
+-- Lease columns used by diagnosis_worker.py to claim scans.
+-- A worker claims a scan by moving it from 'pending' (or an expired
+-- 'processing' lease) to 'processing' with its worker id and a lease expiry.
+alter table scans add column if not exists worker_id text;
+alter table scans add column if not exists lease_expires_at timestamptz;
+
+create index if not exists scans_claimable_idx
+    on scans (diagnosis_status, lease_expires_at);
@@ -0,0 +1,3 @@
+-- Version of the model that produced a scan's diagnosis, written by
+-- diagnosis_worker.py alongside diagnosis_type and confidence_score.
+alter table scans add column if not exists model_version text;
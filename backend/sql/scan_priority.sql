@@ -0,0 +1,5 @@
+-- Optional scheduling priority read by diagnosis_worker.py: 'urgent',
+-- 'normal' or 'bulk' (e.g. set by bulk imports). When null the worker derives
+-- it from scan_type and the uploader's subscription_plan.
+alter table scans add column if not exists priority text
+    check (priority in ('urgent', 'normal', 'bulk'));
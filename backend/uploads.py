@@ -0,0 +1,325 @@
+import asyncio
+import hashlib
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Largest accepted upload; bigger bodies are rejected with 413 as soon as the
+# Content-Length (or, without one, the streamed byte count) shows they are over.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(64 * 2**20)))
+
+# Uploads are kept in memory up to this size and spooled to a temp file beyond it
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(2**20)))
+
+# Limit for plain (non-file) form fields such as scan_type
+MAX_FIELD_BYTES = 64 * 2**10
+
+# Read size when extracting archive members
+_MEMBER_CHUNK_BYTES = 2**20
+
+# Room for multipart boundaries, part headers and small form fields
+_MULTIPART_OVERHEAD = 64 * 2**10
+
+# Uploads recognised as archives of images (batch prediction)
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+ARCHIVE_TYPES = ("application/zip", "application/x-zip-compressed", "application/x-tar",
+                 "application/gzip", "application/x-gzip", "application/x-gtar")
+
+
+class UploadError(Exception):
+    """A rejected upload, carrying the HTTP status it should be answered with"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class SpooledUpload:
+    """One uploaded file, hashed while it streamed in and spooled in memory or on disk.
+
+    `file` is positioned at the start and can be handed straight to PIL.
+    Close the upload (or use it as a context manager) to drop the temp file.
+    """
+
+    def __init__(self, spool_bytes: int):
+        self.filename = None
+        self.content_type = None
+        self.size = 0
+        self.sha256 = None
+        self.fields = {}
+        self.spool_bytes = spool_bytes
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+
+    def reader(self) -> io.BufferedReader:
+        """A BufferedReader over the upload, for clients that only stream those (storage uploads)"""
+        self.file.seek(0)
+        return io.BufferedReader(self.file)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _PartReader:
+    """python-multipart callbacks routing file fields into SpooledUploads"""
+
+    def __init__(self, file_field, max_files: int, max_bytes: int, max_total_bytes: int, spool_bytes: int):
+        self.file_field = file_field  # None accepts file parts under any field name
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.spool_bytes = spool_bytes
+        self.uploads = []
+        self.fields = {}
+        self.total_bytes = 0
+        self.pending = []       # (upload, chunk) parsed but not yet written
+        self.headers = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.field_name = None
+        self.field_data = None  # bytearray for form fields, None while in a file part or a skipped one
+        self.current = None     # SpooledUpload of the file part being read
+        self.digest = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data, start, end):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition"))
+        self.field_name = options.get(b"name", b"").decode("latin-1")
+        filename = options.get(b"filename")
+        self.current = None
+        if filename is None:
+            self.field_data = bytearray()
+            return
+        if self.file_field not in (None, self.field_name):
+            # A file under another field name is skipped, as a form parser would
+            self.field_data = None
+            return
+        if len(self.uploads) >= self.max_files:
+            raise UploadError(413, f"More than {self.max_files} files in one request")
+
+        # spool_bytes is the in-memory budget for the whole request, so with
+        # many files only the first ones stay in RAM and the rest go to disk.
+        in_memory = sum(upload.size for upload in self.uploads if upload.size <= upload.spool_bytes)
+        self.current = SpooledUpload(max(1, self.spool_bytes - in_memory))
+        self.current.filename = filename.decode("utf-8", "replace")
+        self.current.content_type = self.headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+        self.current.fields = self.fields
+        self.uploads.append(self.current)
+        self.digest = hashlib.sha256()
+        self.field_data = None
+
+    def on_part_data(self, data, start, end):
+        if self.current is not None:
+            self.current.size += end - start
+            self.total_bytes += end - start
+            if self.current.size > self.max_bytes:
+                raise UploadError(413, f"Upload exceeds {self.max_bytes} bytes")
+            if self.total_bytes > self.max_total_bytes:
+                raise UploadError(413, f"Request exceeds {self.max_total_bytes} bytes")
+            chunk = data[start:end]
+            self.digest.update(chunk)
+            self.pending.append((self.current, chunk))
+        elif self.field_data is not None:
+            self.field_data += data[start:end]
+            if len(self.field_data) > MAX_FIELD_BYTES:
+                raise UploadError(413, f"Form field {self.field_name} exceeds {MAX_FIELD_BYTES} bytes")
+        else:
+            # Skipped file parts are not stored but still count towards the request limit
+            self.total_bytes += end - start
+            if self.total_bytes > self.max_total_bytes:
+                raise UploadError(413, f"Request exceeds {self.max_total_bytes} bytes")
+
+    def on_part_end(self):
+        if self.current is not None:
+            self.current.sha256 = self.digest.hexdigest()
+        elif self.field_data is not None:
+            self.fields[self.field_name] = self.field_data.decode("utf-8", "replace")
+        self.current = None
+        self.field_data = None
+
+
+def _check_content_length(request, limit: int):
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise UploadError(413, f"Upload exceeds {limit} bytes")
+
+
+async def _write_pending(reader: _PartReader):
+    chunks, reader.pending = reader.pending, []
+    for upload, chunk in chunks:
+        if upload.size > upload.spool_bytes:
+            # Past the spool threshold writes hit the disk; keep them off the event loop
+            await asyncio.to_thread(upload.file.write, chunk)
+        else:
+            upload.file.write(chunk)
+
+
+async def receive_uploads(request, file_field: str = None, max_files: int = 1, max_bytes: int = MAX_UPLOAD_BYTES,
+                          max_total_bytes: int = None, spool_bytes: int = UPLOAD_SPOOL_BYTES) -> list:
+    """Stream a multipart/form-data request body into SpooledUploads, one per file part.
+
+    Unlike UploadFile + read(), the body is never held in memory more than
+    once: chunks are hashed and written to spooled temp files as they
+    arrive, and oversized uploads are refused before (or while) reading.
+    `max_bytes` limits each file and `max_total_bytes` the whole request.
+    Plain form fields end up in every upload's `fields`. Raises UploadError.
+    """
+    max_total_bytes = max_total_bytes or max_bytes * max_files
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError(400, "Expected a multipart/form-data upload")
+    _check_content_length(request, max_total_bytes + _MULTIPART_OVERHEAD * max_files)
+
+    reader = _PartReader(file_field, max_files, max_bytes, max_total_bytes, spool_bytes)
+    parser = MultipartParser(boundary, reader.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await _write_pending(reader)
+        parser.finalize()
+    except BaseException as e:
+        # Rejected or disconnected mid-upload: drop whatever was spooled
+        for upload in reader.uploads:
+            upload.close()
+        if isinstance(e, MultipartParseError):
+            raise UploadError(400, f"Malformed multipart body: {str(e)}")
+        raise
+
+    if not reader.uploads:
+        raise UploadError(400, "No file provided")
+    for upload in reader.uploads:
+        upload.file.seek(0)
+    return reader.uploads
+
+
+async def receive_upload(request, file_field: str = "file", max_bytes: int = MAX_UPLOAD_BYTES,
+                         spool_bytes: int = UPLOAD_SPOOL_BYTES) -> SpooledUpload:
+    """Stream the single `file_field` file of a multipart request into a SpooledUpload"""
+    uploads = await receive_uploads(request, file_field, 1, max_bytes, spool_bytes=spool_bytes)
+    return uploads[0]
+
+
+async def receive_body(request, max_bytes: int = MAX_UPLOAD_BYTES, spool_bytes: int = UPLOAD_SPOOL_BYTES) -> SpooledUpload:
+    """Stream a raw (non-multipart) request body, e.g. an archive, into a SpooledUpload"""
+    _check_content_length(request, max_bytes)
+    upload = SpooledUpload(spool_bytes)
+    upload.content_type = request.headers.get("content-type", "application/octet-stream")
+    digest = hashlib.sha256()
+    try:
+        async for chunk in request.stream():
+            upload.size += len(chunk)
+            if upload.size > max_bytes:
+                raise UploadError(413, f"Upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            if upload.size > spool_bytes:
+                await asyncio.to_thread(upload.file.write, chunk)
+            else:
+                upload.file.write(chunk)
+    except BaseException:
+        upload.close()
+        raise
+
+    upload.sha256 = digest.hexdigest()
+    upload.file.seek(0)
+    return upload
+
+
+def is_archive(upload: SpooledUpload) -> bool:
+    """Whether an upload is a zip or (optionally compressed) tar archive of images"""
+    name = (upload.filename or "").lower()
+    content_type = (upload.content_type or "").split(";")[0].strip().lower()
+    return name.endswith(ARCHIVE_SUFFIXES) or content_type in ARCHIVE_TYPES
+
+
+def _spool_member(name: str, source, spool_bytes: int) -> SpooledUpload:
+    member = SpooledUpload(spool_bytes)
+    member.filename = name
+    digest = hashlib.sha256()
+    try:
+        while True:
+            chunk = source.read(_MEMBER_CHUNK_BYTES)
+            if not chunk:
+                break
+            member.size += len(chunk)
+            digest.update(chunk)
+            member.file.write(chunk)
+    except BaseException:
+        member.close()
+        raise
+    member.sha256 = digest.hexdigest()
+    member.file.seek(0)
+    return member
+
+
+def iter_archive(upload: SpooledUpload, max_member_bytes: int = MAX_UPLOAD_BYTES,
+                 spool_bytes: int = UPLOAD_SPOOL_BYTES):
+    """Yield a hashed SpooledUpload for every regular file in a zip or tar upload.
+
+    Members are extracted one at a time into their own spool, kept in memory
+    up to `spool_bytes` and on disk beyond, so holding several of them does
+    not hold their contents in RAM. Close each one once it is used. Members
+    larger than `max_member_bytes` (uncompressed) raise UploadError before
+    they are extracted.
+    """
+    upload.file.seek(0)
+    if zipfile.is_zipfile(upload.file):
+        upload.file.seek(0)
+        with zipfile.ZipFile(upload.file) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if info.file_size > max_member_bytes:
+                    raise UploadError(413, f"{info.filename} exceeds {max_member_bytes} bytes")
+                with archive.open(info) as source:
+                    member = _spool_member(info.filename, source, spool_bytes)
+                yield member
+        return
+
+    upload.file.seek(0)
+    try:
+        archive = tarfile.open(fileobj=upload.file, mode="r:*")
+    except tarfile.TarError:
+        raise UploadError(400, "Unsupported archive, expected zip or tar")
+    with archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            if member.size > max_member_bytes:
+                raise UploadError(413, f"{member.name} exceeds {max_member_bytes} bytes")
+            yield _spool_member(member.name, archive.extractfile(member), spool_bytes)
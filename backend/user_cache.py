@@ -0,0 +1,53 @@
+import os
+import threading
+import time
+
+# Authenticated users are cached for USER_CACHE_TTL seconds per API process,
+# so a request costs no users lookup. Changes made through this process
+# invalidate their entry at once; other processes see them within the TTL.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+
+class UserCache:
+    """Thread-safe user_id -> user dict map whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_entries: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # user_id -> (expires at, user)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user: dict):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    # Still full of live entries: drop the oldest (dicts keep insertion order)
+                    del self._entries[next(iter(self._entries))]
+            self._entries[user["user_id"]] = (now + self.ttl, user)
+
+    def invalidate(self, user_id):
+        """Forget a user, e.g. after their role changed or they were deleted"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class WriteBehindBuffer:
+    """Collect rows keyed by id and hand them to `flush_fn(rows)` in bulk.
+
+    A background thread flushes once `max_rows` rows are pending or the oldest
+    pending row has waited `max_delay` seconds. Delivery is at least once: when
+    flush_fn raises, its rows go back into the buffer (unless a newer row for
+    the same key arrived meanwhile) and are retried after `retry_interval`,
+    so flush_fn must be idempotent. Call close() on shutdown to flush the rest.
+    """
+
+    def __init__(self, flush_fn, max_rows: int = 100, max_delay: float = 1.0,
+                 retry_interval: float = 5.0, name: str = "write-behind"):
+        self.flush_fn = flush_fn
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.retry_interval = retry_interval
+        self.name = name
+        self._rows = OrderedDict()
+        self._oldest = None            # monotonic time the oldest pending row was added
+        self._retry_at = 0.0
+        self._changed = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+
+    def add(self, key, row: dict):
+        with self._changed:
+            if self._closed:
+                raise RuntimeError(f"{self.name} buffer is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._rows[key] = row
+            self._rows.move_to_end(key)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._rows) >= self.max_rows:
+                self._changed.notify()
+
+    def __len__(self):
+        with self._changed:
+            return len(self._rows)
+
+    def flush(self) -> bool:
+        """Write everything pending now; returns False (keeping the rows) if flush_fn failed"""
+        with self._flush_lock:
+            with self._changed:
+                rows, self._rows = self._rows, OrderedDict()
+                self._oldest = None
+            if not rows:
+                return True
+            try:
+                self.flush_fn(list(rows.values()))
+            except Exception as e:
+                print(f"Failed to write {len(rows)} rows ({self.name}), will retry: {str(e)}")
+                with self._changed:
+                    self.failures += 1
+                    self._retry_at = time.monotonic() + self.retry_interval
+                    for key, row in rows.items():
+                        self._rows.setdefault(key, row)
+                    self._oldest = self._oldest or time.monotonic()
+                return False
+            self.flushes += 1
+            self.rows_written += len(rows)
+            return True
+
+    def _due(self) -> float:
+        """Seconds until the next flush is due (0 = now), or None when nothing is pending"""
+        if not self._rows:
+            return None
+        now = time.monotonic()
+        if now < self._retry_at:
+            return self._retry_at - now
+        if len(self._rows) >= self.max_rows or self._closed:
+            return 0
+        return max(0.0, self._oldest + self.max_delay - now)
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while True:
+                    if self._closed:
+                        return
+                    due = self._due()
+                    if due == 0:
+                        break
+                    self._changed.wait(due)
+            self.flush()
+
+    def close(self, timeout: float = 30):
+        """Stop the background thread and flush what is left, retrying until `timeout`"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        while not self.flush() and time.monotonic() < deadline:
+            time.sleep(min(self.retry_interval, max(0.0, deadline - time.monotonic())))
+        if self._rows:
+            # Their scans keep their leases and will be picked up again once those expire
+            print(f"Gave up writing {len(self._rows)} rows ({self.name}) on shutdown")
+
+    def stats(self) -> dict:
+        with self._changed:
+            return {"pending": len(self._rows), "flushes": self.flushes,
+                    "rows_written": self.rows_written, "failures": self.failures}